@@ -1,102 +1,331 @@
-from openai import OpenAI
-from typing import List, Dict, Any
+from openai import OpenAI, AsyncOpenAI, RateLimitError
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+from collections import OrderedDict, deque
+import numpy as np
+import asyncio
+import hashlib
+import io
+import logging
 from vector_store import Milvus
 import json
 from dotenv import load_dotenv
 import os
-from pymilvus.exceptions import ConnectionNotExistException
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Shortened v3 embeddings; collections created at another size must be dropped and rebuilt
+EMBEDDING_DIMENSIONS = 768
+# Number of embeddings kept in the in-memory LRU cache
+EMBEDDING_CACHE_SIZE = 10000
+# Number of past answers kept for near-duplicate queries
+RESPONSE_CACHE_SIZE = 256
+# Cosine distance under which a query counts as a near-duplicate
+RESPONSE_CACHE_MAX_DISTANCE = 0.05
+# Largest chunk stored, in UTF-8 bytes: the app's chunker emits up to chunk_size + overlap
+# characters (5000 + 200 at the slider maximums), at up to 4 bytes per character
+MAX_CHUNK_BYTES = (5000 + 200) * 4
+# Number of past exchanges kept as conversation context
+CONVERSATION_HISTORY_SIZE = 5
+
+# OpenAI accepts up to 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 2048
+# Stay well under the per-request token limit (roughly 4 characters per token)
+EMBEDDING_BATCH_MAX_TOKENS = 250000
+# Smaller sub-batches submitted concurrently for large ingests
+EMBEDDING_CONCURRENT_BATCH_SIZE = 1024
+EMBEDDING_MAX_CONCURRENCY = 5
+EMBEDDING_MAX_RETRIES = 3
+
 class Agent:
     def __init__(self):
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.embedding_cache = OrderedDict()
+        self.response_cache = deque(maxlen=RESPONSE_CACHE_SIZE)
         self.setup_vector_store()
         self.model = "gpt-4o"
-        self.conversation_history = []
+        self.conversation_history = deque(maxlen=CONVERSATION_HISTORY_SIZE)
         
     def setup_vector_store(self):
         """Initialize or reinitialize the vector store."""
+        # Cached answers may no longer match the knowledge base
+        self.response_cache = deque(maxlen=RESPONSE_CACHE_SIZE)
         self.vector_store = Milvus(
             collection="knowledge",
-            dimension=1536,
-            uri="tmp/milvus.db"
+            dimension=EMBEDDING_DIMENSIONS,
+            uri="tmp/milvus.db",
+            max_text_length=MAX_CHUNK_BYTES
         )
 
-    def get_embedding(self, text: str) -> List[float]:
+    def _embedding_key(self, text: str) -> str:
+        return hashlib.blake2b(f"{EMBEDDING_MODEL}\0{EMBEDDING_DIMENSIONS}\0{text}".encode(), digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[np.ndarray]:
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            self.embedding_cache.move_to_end(key)
+        return embedding
+
+    def _cache_put(self, key: str, embedding: np.ndarray) -> None:
+        self.embedding_cache[key] = embedding
+        self.embedding_cache.move_to_end(key)
+        if len(self.embedding_cache) > EMBEDDING_CACHE_SIZE:
+            self.embedding_cache.popitem(last=False)
+
+    def _split_cached(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], List[str]]:
+        """Return cached embeddings (None on a miss) and the distinct texts still to embed."""
+        embeddings = [self._cache_get(self._embedding_key(text)) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        return embeddings, missing
+
+    def _merge_cached(
+        self,
+        texts: List[str],
+        embeddings: List[Optional[np.ndarray]],
+        missing: List[str],
+        fetched: List[np.ndarray]
+    ) -> List[np.ndarray]:
+        """Cache freshly fetched embeddings and fill them into the misses."""
+        fetched_by_text = dict(zip(missing, fetched))
+        for text, embedding in fetched_by_text.items():
+            self._cache_put(self._embedding_key(text), embedding)
+        return [
+            embedding if embedding is not None else fetched_by_text[text]
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        key = self._embedding_key(text)
+        embedding = self._cache_get(key)
+        if embedding is not None:
+            return embedding
+
         response = self.client.embeddings.create(
-            model="text-embedding-3-small",
+            model=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS,
             input=text
         )
-        return response.data[0].embedding
+        embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+        self._cache_put(key, embedding)
+        return embedding
+
+    def _split_batches(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[str]]:
+        """Split texts into sub-batches that fit the embeddings API limits."""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(text) // 4 + 1
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed many texts with one API request per sub-batch, skipping cached texts."""
+        embeddings, missing = self._split_cached(texts)
+        if not missing:
+            return embeddings
+
+        batches = self._split_batches(missing)
+        if len(batches) > 1:
+            # Several round-trips needed, overlap them
+            fetched = asyncio.run(self._afetch_embeddings(missing))
+        else:
+            fetched = []
+            for batch in batches:
+                response = self.client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    dimensions=EMBEDDING_DIMENSIONS,
+                    input=batch
+                )
+                fetched.extend(
+                    np.asarray(d.embedding, dtype=np.float32)
+                    for d in sorted(response.data, key=lambda d: d.index)
+                )
+        return self._merge_cached(texts, embeddings, missing, fetched)
+
+    async def _aembed_batch(self, client: AsyncOpenAI, batch: List[str], semaphore: asyncio.Semaphore) -> List[np.ndarray]:
+        """Embed one sub-batch, backing off on rate limits."""
+        async with semaphore:
+            for attempt in range(EMBEDDING_MAX_RETRIES):
+                try:
+                    response = await client.embeddings.create(
+                        model=EMBEDDING_MODEL,
+                        dimensions=EMBEDDING_DIMENSIONS,
+                        input=batch
+                    )
+                    return [
+                        np.asarray(d.embedding, dtype=np.float32)
+                        for d in sorted(response.data, key=lambda d: d.index)
+                    ]
+                except RateLimitError as e:
+                    if attempt == EMBEDDING_MAX_RETRIES - 1:
+                        raise
+                    retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                    try:
+                        delay = float(retry_after)
+                    except (TypeError, ValueError):
+                        delay = 2 ** attempt
+                    await asyncio.sleep(delay)
+
+    async def _afetch_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """Fetch embeddings from the API, submitting sub-batches concurrently."""
+        semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+        batches = self._split_batches(texts, EMBEDDING_CONCURRENT_BATCH_SIZE)
+        # The async client is bound to the running event loop, so scope it to this call
+        async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as client:
+            results = await asyncio.gather(*[self._aembed_batch(client, batch, semaphore) for batch in batches])
+        # gather preserves order, so results line up with the input texts
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    async def aget_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed many texts, submitting sub-batches concurrently and skipping cached texts."""
+        embeddings, missing = self._split_cached(texts)
+        if not missing:
+            return embeddings
+        fetched = await self._afetch_embeddings(missing)
+        return self._merge_cached(texts, embeddings, missing, fetched)
+
+    def _store_embeddings(self, texts: List[str], embeddings: List[np.ndarray]) -> List[int]:
+        # New knowledge can change answers, drop cached ones
+        self.response_cache.clear()
+        # Reconnects and error logging are handled inside the vector store
+        return self.vector_store.store_vectors(texts, embeddings)
 
     def store_knowledge(self, text: str) -> int:
-        try:
-            embedding = self.get_embedding(text)
-            return self.vector_store.store_vectors([text], [embedding])[0]
-        except ConnectionNotExistException:
-            # Reconnect and try again
-            print("Reconnecting to Milvus...")
-            self.setup_vector_store()
-            embedding = self.get_embedding(text)
-            return self.vector_store.store_vectors([text], [embedding])[0]
-        except Exception as e:
-            print(f"Error storing knowledge: {e}")
-            raise
+        return self.store_knowledge_batch([text], flush=False)[0]
 
-    def search_knowledge(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        try:
-            query_embedding = self.get_embedding(query)
-            return self.vector_store.search_vectors(query_embedding, top_k)
-        except ConnectionNotExistException:
-            # Reconnect and try again
-            print("Reconnecting to Milvus...")
-            self.setup_vector_store()
-            query_embedding = self.get_embedding(query)
-            return self.vector_store.search_vectors(query_embedding, top_k)
-        except Exception as e:
-            print(f"Error searching knowledge: {e}")
-            raise
+    def store_knowledge_batch(self, texts: List[str], flush: bool = True) -> List[int]:
+        if not texts:
+            return []
+        embeddings = self.get_embeddings_batch(texts)
+        ids = self._store_embeddings(texts, embeddings)
+        if flush:
+            self.vector_store.flush()
+        return ids
+
+    async def astore_knowledge_batch(self, texts: List[str], flush: bool = True) -> List[int]:
+        if not texts:
+            return []
+        embeddings = await self.aget_embeddings_batch(texts)
+        ids = self._store_embeddings(texts, embeddings)
+        if flush:
+            self.vector_store.flush()
+        return ids
+
+    def search_knowledge(self, query: Union[str, np.ndarray], top_k: int = 3) -> List[Dict[str, Any]]:
+        """Search by query text, or by an already computed query embedding."""
+        query_embedding = self.get_embedding(query) if isinstance(query, str) else query
+        return self.vector_store.search_vectors(query_embedding, top_k)
+
+    def _lookup_response_cache(self, query_embedding: np.ndarray) -> Optional[str]:
+        """Return a cached answer for a near-duplicate query, if any."""
+        if not self.response_cache:
+            return None
+        cached_embeddings = np.array([embedding for embedding, _ in self.response_cache])
+        # Embeddings are unit-normalized, so the dot product is the cosine similarity
+        similarities = cached_embeddings @ query_embedding
+        best = int(np.argmax(similarities))
+        if 1.0 - similarities[best] < RESPONSE_CACHE_MAX_DISTANCE:
+            return self.response_cache[best][1]
+        return None
+
+    def _build_messages(self, query: str, query_embedding: np.ndarray) -> List[Dict[str, str]]:
+        """Build the chat messages for a query from retrieved context and history."""
+        # Search for relevant knowledge, reusing the query embedding
+        relevant_knowledge = self.search_knowledge(query_embedding)
+
+        # Build one system message with the context and previous conversation
+        system_prompt = io.StringIO()
+        system_prompt.write("You are a helpful AI assistant. Use the provided context to answer questions accurately.\n\n")
+        system_prompt.write("Relevant context:\n")
+        for item in relevant_knowledge:
+            system_prompt.write(item["text"])
+            system_prompt.write("\n")
+        system_prompt.write("\nPrevious conversation:\n")
+        for msg in self.conversation_history:
+            system_prompt.write(f"User: {msg['user']}\nAssistant: {msg['assistant']}\n")
+
+        return [
+            {"role": "system", "content": system_prompt.getvalue()},
+            {"role": "user", "content": query}
+        ]
+
+    def _record_exchange(self, query: str, answer: str, query_embedding: Optional[np.ndarray] = None) -> None:
+        """Store the exchange in history and, for fresh answers, in the response cache."""
+        self.conversation_history.append({
+            "user": query,
+            "assistant": answer
+        })
+        if query_embedding is not None:
+            self.response_cache.append((query_embedding, answer))
 
     def generate_response(self, query: str) -> str:
         try:
-            # Search for relevant knowledge
-            relevant_knowledge = self.search_knowledge(query)
-            context = "\n".join([item["text"] for item in relevant_knowledge])
-
-            # Prepare conversation history
-            history = "\n".join([
-                f"User: {msg['user']}\nAssistant: {msg['assistant']}"
-                for msg in self.conversation_history[-5:]  # Keep last 5 exchanges
-            ])
+            # Answer near-duplicate queries from the cache
+            query_embedding = self.get_embedding(query)
+            cached_response = self._lookup_response_cache(query_embedding)
+            if cached_response is not None:
+                self._record_exchange(query, cached_response)
+                return cached_response
 
             # Generate response
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant. Use the provided context to answer questions accurately."},
-                    {"role": "system", "content": f"Relevant context:\n{context}"},
-                    {"role": "system", "content": f"Previous conversation:\n{history}"},
-                    {"role": "user", "content": query}
-                ],
+                messages=self._build_messages(query, query_embedding),
                 temperature=0.7
             )
 
-            # Store the exchange in history
-            self.conversation_history.append({
-                "user": query,
-                "assistant": response.choices[0].message.content
-            })
-
-            return response.choices[0].message.content
-        except ConnectionNotExistException:
-            # Reconnect and try again
-            print("Reconnecting to Milvus...")
-            self.setup_vector_store()
-            return self.generate_response(query)
+            answer = response.choices[0].message.content
+            self._record_exchange(query, answer, query_embedding)
+            return answer
         except Exception as e:
-            print(f"Error generating response: {e}")
+            logger.exception("Error generating response")
             return f"I'm sorry, I encountered an error: {str(e)}"
 
+    def generate_response_stream(self, query: str) -> Iterator[str]:
+        """
+        Generate a response, yielding text as the model produces it.
+        
+        The full answer is added to the conversation history once the stream ends.
+        """
+        try:
+            # Answer near-duplicate queries from the cache
+            query_embedding = self.get_embedding(query)
+            cached_response = self._lookup_response_cache(query_embedding)
+            if cached_response is not None:
+                self._record_exchange(query, cached_response)
+                yield cached_response
+                return
+
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(query, query_embedding),
+                temperature=0.7,
+                stream=True
+            )
+
+            parts = []
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+            self._record_exchange(query, "".join(parts), query_embedding)
+        except Exception as e:
+            logger.exception("Error generating response")
+            yield f"I'm sorry, I encountered an error: {str(e)}"
+
     def get_conversation_history(self) -> List[Dict[str, str]]:
-        return self.conversation_history 
\ No newline at end of file
+        return list(self.conversation_history) 
\ No newline at end of file
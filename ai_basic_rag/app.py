@@ -196,29 +196,25 @@ with st.sidebar:
                             chunks = chunk_text(text, chunk_size, chunk_overlap)
                             st.info(f"Created {len(chunks)} chunks")
                             
-                            # Store each chunk with progress tracking
+                            # Store all chunks in a single batch
                             st.write("💾 Storing chunks...")
                             chunk_progress = st.progress(0)
                             stored_ids = []
-                            
-                            for i, chunk in enumerate(chunks):
+
+                            try:
+                                stored_ids = agent.store_knowledge_batch(chunks)
+                                chunk_progress.progress(1.0)
+                            except Exception as e:
+                                st.error(f"Error storing chunks: {e}")
+                                # Try to reconnect
                                 try:
-                                    chunk_id = agent.store_knowledge(chunk)
-                                    stored_ids.append(chunk_id)
-                                    chunk_progress.progress((i + 1) / len(chunks))
-                                except Exception as e:
-                                    st.error(f"Error storing chunk {i+1}: {e}")
-                                    # Try to reconnect
-                                    try:
-                                        agent.setup_vector_store()
-                                        # Retry this chunk
-                                        chunk_id = agent.store_knowledge(chunk)
-                                        stored_ids.append(chunk_id)
-                                        chunk_progress.progress((i + 1) / len(chunks))
-                                    except:
-                                        st.error("Failed to reconnect. Some chunks may not be stored.")
-                                        break
-                            
+                                    agent.setup_vector_store()
+                                    # Retry the batch
+                                    stored_ids = agent.store_knowledge_batch(chunks)
+                                    chunk_progress.progress(1.0)
+                                except:
+                                    st.error("Failed to reconnect. Chunks may not be stored.")
+
                             st.success(f"✅ PDF processed and stored in {len(stored_ids)} chunks")
                         else:
                             # Store as a single chunk
@@ -260,10 +256,12 @@ with col1:
             
             with st.spinner("Thinking..."):
                 try:
-                    response = agent.generate_response(user_input)
-                    
-                    # Display AI response
-                    st.markdown(f'<div class="chat-message-ai"><strong>AI:</strong><br>{response}</div>', unsafe_allow_html=True)
+                    # Display AI response as it streams in
+                    response_placeholder = st.empty()
+                    response = ""
+                    for token in agent.generate_response_stream(user_input):
+                        response += token
+                        response_placeholder.markdown(f'<div class="chat-message-ai"><strong>AI:</strong><br>{response}</div>', unsafe_allow_html=True)
                     
                     # Add to chat history
                     st.session_state.chat_history.append({
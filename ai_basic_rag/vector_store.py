@@ -1,16 +1,82 @@
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union
+from functools import wraps
+import logging
+import math
 import os
+import random
+import time
 from pymilvus.exceptions import ConnectionNotExistException
 
+logger = logging.getLogger(__name__)
+
+# Connection aliases shared by all instances, keyed on (uri, token)
+_CONNECTIONS: Dict[Tuple[str, str], str] = {}
+
+# Default build parameters per supported index type
+DEFAULT_INDEX_PARAMS = {
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 48, "nbits": 8},
+}
+
+# Marker for retry_on_disconnect: re-raise errors instead of returning a fallback
+_RAISE = object()
+
+def retry_on_disconnect(
+    tries: int = 3,
+    backoff: float = 0.5,
+    jitter: Tuple[float, float] = (0, 0.3),
+    setup: bool = True,
+    fallback: Any = _RAISE
+):
+    """
+    Retry a Milvus method after reconnecting when its connection has gone away.
+    
+    Other errors are logged and re-raised, or replaced by fallback when one is given.
+    
+    Args:
+        tries: Total number of attempts before the exception is re-raised
+        backoff: Base delay in seconds, doubled after every failed attempt
+        jitter: Range of random seconds added to each delay
+        setup: Whether to re-open the collection after reconnecting
+        fallback: Value returned instead of raising on errors other than a lost connection
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            for attempt in range(tries):
+                try:
+                    return func(self, *args, **kwargs)
+                except ConnectionNotExistException:
+                    if attempt == tries - 1:
+                        raise
+                    time.sleep(backoff * 2 ** attempt + random.uniform(*jitter))
+                    self._connect()
+                    if setup:
+                        self._setup_collection()
+                except Exception:
+                    logger.exception("Milvus %s failed", func.__name__.strip("_"))
+                    if fallback is _RAISE:
+                        raise
+                    return fallback
+        return wrapper
+    return decorator
+
 class Milvus:
     def __init__(
         self,
         collection: str = "knowledge",
         dimension: int = 1536,
         uri: str = "tmp/milvus.db",
-        token: Optional[str] = None
+        token: Optional[str] = None,
+        index_type: str = "IVF_SQ8",
+        index_params: Optional[Dict[str, Any]] = None,
+        nlist: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        expected_size: Optional[int] = None,
+        max_text_length: int = 2048
     ):
         """
         Milvus vector database implementation.
@@ -22,12 +88,37 @@ class Milvus:
                 - For local storage with Milvus Lite, use a path ending with .db (e.g., "tmp/milvus.db")
                 - For a Milvus server, use http://host:port format
             token: Optional authentication token for Milvus server
+            index_type: Index used for the embedding field
+                - "IVF_FLAT": exact vectors per cell, highest recall, most memory
+                - "IVF_SQ8": int8 scalar quantization, ~4x less memory
+                - "IVF_PQ": product quantization for very large corpora, ~30x less memory
+            index_params: Optional build parameters overriding the defaults for index_type.
+                nlist is the number of IVF cells; searches scan nprobe of them, so more
+                cells mean fewer comparisons per cell but need a higher nprobe for the
+                same recall. For IVF_PQ, m sub-vectors (must divide the dimension) of
+                nbits each trade recall for memory.
+            nlist: Number of IVF cells, overrides index_params
+            nprobe: Number of cells scanned per search (default 10, capped at nlist)
+            expected_size: Optional hint of the corpus size; when nlist is not given,
+                nlist is derived as sqrt(expected_size) (at least 16)
+            max_text_length: Maximum size of the text field in bytes (UTF-8). This is a hard
+                cap enforced on insert, so it should match the chunker's maximum chunk length.
+                Only applies when the collection is created.
         """
         self.collection_name = collection
         self.dimension = dimension
         self.uri = uri
         self.token = token
-        self.connection_alias = "default"
+        self.index_type = index_type
+        self.index_params = dict(index_params or DEFAULT_INDEX_PARAMS.get(index_type, {"nlist": 1024}))
+        if nlist is not None:
+            self.index_params["nlist"] = nlist
+        elif expected_size is not None:
+            self.index_params["nlist"] = max(16, int(math.sqrt(expected_size)))
+        self.max_text_length = max_text_length
+        self.nprobe = nprobe if nprobe is not None else min(10, self.index_params.get("nlist", 10))
+        self._loaded = False
+        self.connection_alias = _CONNECTIONS.setdefault((uri, token or ""), f"milvus_{len(_CONNECTIONS)}")
         
         # Ensure directory exists for local DB
         if uri.startswith("tmp/") or uri.startswith("./"):
@@ -38,9 +129,12 @@ class Milvus:
         self._setup_collection()
 
     def _connect(self):
-        """Connect to Milvus server or local storage."""
+        """Connect to Milvus server or local storage, reusing a live shared connection."""
         try:
-            # Disconnect first if we're already connected to avoid issues
+            if connections.has_connection(self.connection_alias):
+                return
+
+            # Drop the stale registration before reconnecting
             try:
                 connections.disconnect(alias=self.connection_alias)
             except:
@@ -52,136 +146,119 @@ class Milvus:
                 uri=self.uri,
                 token=self.token
             )
-        except Exception as e:
-            print(f"Connection error: {e}")
+        except Exception:
+            logger.exception("Connection error")
             raise
 
+    @retry_on_disconnect(setup=False)
     def _setup_collection(self):
         """Set up the collection if it doesn't exist."""
-        try:
-            if not utility.has_collection(self.collection_name):
-                fields = [
-                    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                    FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-                    FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension)
-                ]
-                schema = CollectionSchema(fields=fields)
-                self.collection = Collection(name=self.collection_name, schema=schema)
-                
-                # Create index
-                index_params = {
-                    "metric_type": "L2",
-                    "index_type": "IVF_FLAT",
-                    "params": {"nlist": 1024}
-                }
-                self.collection.create_index(field_name="embedding", index_params=index_params)
-                self.collection.load()
-            else:
-                self.collection = Collection(self.collection_name)
-                self.collection.load()
-        except ConnectionNotExistException:
-            self._connect()
-            self._setup_collection()
-        except Exception as e:
-            print(f"Setup collection error: {e}")
-            raise
+        if not utility.has_collection(self.collection_name, using=self.connection_alias):
+            fields = [
+                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+                FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=self.max_text_length),
+                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension)
+            ]
+            schema = CollectionSchema(fields=fields)
+            self.collection = Collection(name=self.collection_name, schema=schema, using=self.connection_alias)
+            
+            # Create index
+            index_params = {
+                "metric_type": "IP",
+                "index_type": self.index_type,
+                "params": self.index_params
+            }
+            self.collection.create_index(field_name="embedding", index_params=index_params)
+        else:
+            self.collection = Collection(self.collection_name, using=self.connection_alias)
+
+        # Loading pulls segments into memory, only do it once
+        if not self._loaded:
+            self.collection.load()
+            self._loaded = True
 
-    def store_vectors(self, texts: List[str], embeddings: List[List[float]]) -> List[int]:
+    @retry_on_disconnect()
+    def store_vectors(self, texts: List[str], embeddings: Union[np.ndarray, List[np.ndarray]]) -> List[int]:
         """
         Store vectors in the collection.
         
         Args:
             texts: List of text content
-            embeddings: List of embedding vectors
+            embeddings: float32 array of shape (N, dimension), or a list of N vectors
             
         Returns:
             List of primary keys for the inserted entities
         """
-        try:
-            entities = [
-                texts,
-                embeddings
-            ]
-            insert_result = self.collection.insert(entities)
-            self.collection.flush()
-            return insert_result.primary_keys
-        except ConnectionNotExistException:
-            self._connect()
-            self._setup_collection()
-            return self.store_vectors(texts, embeddings)
-        except Exception as e:
-            print(f"Store vectors error: {e}")
-            raise
+        entities = [
+            texts,
+            np.asarray(embeddings, dtype=np.float32)
+        ]
+        insert_result = self.collection.insert(entities)
+        return insert_result.primary_keys
 
-    def search_vectors(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+    @retry_on_disconnect()
+    def flush(self) -> None:
         """
-        Search for vectors similar to the query embedding.
+        Seal pending inserts into persisted segments.
+        
+        Inserts are not flushed individually; call this once after a bulk ingest.
+        """
+        self.collection.flush()
+
+    @retry_on_disconnect()
+    def search_vectors(
+        self,
+        query_embeddings: Union[np.ndarray, List[np.ndarray]],
+        top_k: int = 5
+    ) -> Union[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+        """
+        Search for vectors similar to one or more query embeddings.
         
         Args:
-            query_embedding: The embedding vector to search for
-            top_k: Number of results to return
+            query_embeddings: A single float32 embedding vector, or several as a
+                (Q, dimension) array or list, searched in one request
+            top_k: Number of results to return per query
             
         Returns:
-            List of dictionaries containing id, text, and distance
+            For a single query, a list of dictionaries containing id, text, and distance
+            (inner product, higher is closer); for several queries, one such list per query
         """
-        try:
-            search_params = {
-                "metric_type": "L2",
-                "params": {"nprobe": 10}
-            }
-            results = self.collection.search(
-                data=[query_embedding],
-                anns_field="embedding",
-                param=search_params,
-                limit=top_k,
-                output_fields=["text"]
-            )
-            
-            return [
-                {
-                    "id": hit.id,
-                    "text": hit.entity.get("text"),
-                    "distance": hit.distance
-                }
-                for hit in results[0]
-            ]
-        except ConnectionNotExistException:
-            self._connect()
-            self._setup_collection()
-            return self.search_vectors(query_embedding, top_k)
-        except Exception as e:
-            print(f"Search vectors error: {e}")
-            raise
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        single_query = queries.ndim == 1
+        if single_query:
+            queries = queries[np.newaxis, :]
+
+        search_params = {
+            "metric_type": "IP",
+            "params": {"nprobe": self.nprobe}
+        }
+        results = self.collection.search(
+            data=queries,
+            anns_field="embedding",
+            param=search_params,
+            limit=top_k,
+            output_fields=["text"]
+        )
+        
+        # Ids and distances come back as columns, only text needs a per-hit lookup
+        matches = []
+        for hits in results:
+            texts = [hit.entity.get("text") for hit in hits]
+            matches.append([
+                {"id": hit_id, "text": text, "distance": distance}
+                for hit_id, text, distance in zip(hits.ids, texts, hits.distances)
+            ])
+        return matches[0] if single_query else matches
         
+    @retry_on_disconnect(setup=False, fallback=False)
     def exists(self) -> bool:
         """Check if the collection exists."""
-        try:
-            return utility.has_collection(self.collection_name)
-        except ConnectionNotExistException:
-            self._connect()
-            return self.exists()
-        except Exception as e:
-            print(f"Exists error: {e}")
-            return False
+        return utility.has_collection(self.collection_name, using=self.connection_alias)
         
+    @retry_on_disconnect(fallback=None)
     def drop(self) -> None:
         """Drop the collection if it exists."""
-        try:
-            if self.exists():
-                self.collection.release()
-                utility.drop_collection(self.collection_name)
-        except ConnectionNotExistException:
-            self._connect()
-            self.drop()
-        except Exception as e:
-            print(f"Drop error: {e}")
-
-    def __del__(self):
-        """Clean up resources when the object is deleted."""
-        try:
-            if hasattr(self, 'collection'):
-                self.collection.release()
-            connections.disconnect(alias=self.connection_alias)
-        except:
-            # Ignore errors during cleanup
-            pass 
\ No newline at end of file
+        if self.exists():
+            self.collection.release()
+            utility.drop_collection(self.collection_name, using=self.connection_alias)
+            self._loaded = False
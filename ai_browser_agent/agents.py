@@ -7,18 +7,22 @@ Provides agent functionality for browser automation using natural language proce
 import os
 import re
 import time
-import base64
+import binascii
 import io
-import json
+import orjson
 import logging
 import asyncio
+from collections import deque, OrderedDict
+from contextlib import aclosing
 from typing import List, Dict, Any, Optional, Union, Tuple
 from PIL import Image
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 from pathlib import Path
-from bs4 import BeautifulSoup
-from playwright.async_api import Page, Browser, BrowserContext
+from urllib.parse import quote_plus
+from bs4 import BeautifulSoup, SoupStrainer
+from playwright.async_api import Page, Browser, BrowserContext, Error as PlaywrightError
 
 from config import (
     is_known_searchable_site,
@@ -35,6 +39,204 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# HTTP/2 connection pool shared by every agent's OpenAI client, so calls reuse warm connections
+_HTTP_CLIENT = DefaultAsyncHttpxClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    timeout=60.0
+)
+_OPENAI_CLIENT: Optional[AsyncOpenAI] = None
+
+def _get_client() -> AsyncOpenAI:
+    """Return the OpenAI client shared by all agents, creating it on first use."""
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is None:
+        _OPENAI_CLIENT = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=_HTTP_CLIENT)
+    return _OPENAI_CLIENT
+
+# Command patterns for process_command, compiled once at import.
+# Captures exclude surrounding whitespace (commands arrive stripped), so groups are used as is.
+# Optional quotes and whitespace each have only one way to match, so failed matches don't backtrack over them.
+# Verbs with several command forms use one alternation with named groups, tried in the listed order.
+GO_RE = re.compile(
+    r"go\s+to\s+(?:"
+    r"(?P<site>[a-z0-9.-]+)(?:\.com|\.org|\.net|\.in|\.co|\.io)?\s+and\s+search\s+for\s+(?P<query>.*)"
+    r"|(?P<url>.*))"
+)
+ON_SITE_SEARCH_RE = re.compile(r"on\s+(?P<site>[a-z0-9.-]+)(?:\.com|\.org|\.net|\.in|\.co|\.io)?\s+search\s+for\s+(?P<query>.*)")
+SEARCH_RE = re.compile(r"(search|find)\s+(?:for\s+)?(.*)")
+OPEN_RE = re.compile(r"open\s+(?P<url>.*)")
+CLICK_RE = re.compile(r"click\s+(?:on\s+)?(?:the\s+)?(?:button\s+)?(?:link\s+)?(?:with\s+text\s+)?(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?")
+CLICK_SELECTOR_RE = re.compile(r"click\s+(?:on\s+)?(?:the\s+)?(?:element\s+with\s+)?(?:selector|css)\s+(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?")
+SELECT_FIRST_RE = re.compile(r"select\s+(?:the\s+)?first\s+(?:item|result)(?:\s+with\s+(.+))?")
+TYPE_RE = re.compile(r"type\s+(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?\s+in(?:to)?\s+(?:the\s+)?(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?(?:\s+field)?")
+SCROLL_RE = re.compile(r"scroll\s+(up|down)(?:\s+(\d+))?")
+FIND_TEXT_RE = re.compile(r"find\s+(?:text\s+)?(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?(?:\s+on\s+(?:the\s+)?page)?")
+RUN_JS_RE = re.compile(r"(?:run|execute)\s+(?:js|javascript)\s+(.+)")
+WAIT_RE = re.compile(r"wait\s+(?:for\s+(?P<selector>.+)|(?P<seconds>\d+)(?:\s+seconds)?)")
+DIALOG_RE = re.compile(r"(accept|dismiss|handle)\s+(?:the\s+)?(dialog|alert|popup)(?:\s+with\s+text\s+(?:[\"']\s*)?([^\"'\s](?:[^\"']*[^\"'\s])?)(?:\s*[\"'])?)?")
+# Dialog command verb -> how the dialog is handled
+DIALOG_ACTIONS = {"accept": "accept", "dismiss": "dismiss", "handle": "dismiss"}
+# Commands matched as whole strings, mapped to their action
+SIMPLE_COMMANDS = {
+    "back": "back",
+    "go back": "back",
+    "forward": "forward",
+    "go forward": "forward",
+    "refresh": "refresh",
+    "reload": "refresh",
+    "screenshot": "screenshot",
+    "take screenshot": "screenshot",
+    "capture": "screenshot",
+    "analyze": "analyze",
+    "analyze page": "analyze",
+    "what's on this page": "analyze",
+    "what is on this page": "analyze",
+    "extract data": "extract_data",
+    "extract info": "extract_data",
+    "get data": "extract_data",
+    "extract": "extract_data",
+    "exit": "exit",
+    "quit": "exit",
+    "close": "exit",
+    "help": "help",
+    "commands": "help",
+    "usage": "help",
+}
+# One prebuilt result per fixed action, returned as is; callers must not mutate them
+_SIMPLE_ACTION_RESULTS = {action: {"action": action} for action in set(SIMPLE_COMMANDS.values())}
+SIMPLE_COMMAND_RESULTS = {command: _SIMPLE_ACTION_RESULTS[action] for command, action in SIMPLE_COMMANDS.items()}
+# Results of parameterless pattern commands, shared like the ones above
+SUBMIT_FORM_RESULT = {"action": "submit_form"}
+SELECT_FIRST_ANY_RESULT = {"action": "select_first_item", "query_terms": None}
+# Fixed actions that are not browser actions and stay out of memory
+UNRECORDED_ACTIONS = frozenset({"exit", "help"})
+# Domain endings that mark a bare host as already complete
+TLD_RE = re.compile(r"\.(?:com|org|net|io|gov|edu|co|in)$")
+
+# Main content areas, in priority order
+MAIN_CONTENT_SELECTORS = ['main', '[role="main"]', 'article', '#content', '.content', '#main', '.main', 'section']
+# Only build the parts of the document main content can come from
+MAIN_CONTENT_STRAINER = SoupStrainer(['main', 'article', 'section', 'div', 'body'])
+# Characters of main content read from the live page, a little over what prompts use
+MAIN_CONTENT_MAX_CHARS = 1200
+# Reads the main content text straight from the live DOM
+MAIN_CONTENT_JS = """
+([selectors, maxChars]) => {
+    let el = null;
+    for (const selector of selectors) {
+        el = document.querySelector(selector);
+        if (el) break;
+    }
+    el = el || document.body;
+    return el ? (el.innerText || '').slice(0, maxChars) : '';
+}
+"""
+
+# JPEG quality for screenshots that are only sent to the Vision API
+SCREENSHOT_JPEG_QUALITY = 70
+
+# Longest image side sent to the Vision API for each detail level, larger screenshots are downscaled
+VISION_MAX_DIMENSIONS = {"high": 1536, "low": 768}
+VISION_JPEG_QUALITY = 80
+
+# Number of past steps kept in agent memory
+MEMORY_SIZE = 20
+
+# Number of refined plan steps remembered per agent, keyed by step and page URL
+REFINE_CACHE_SIZE = 128
+
+# Commands that load a different page, making the cached DOM structure and main content stale
+PAGE_CHANGING_ACTIONS = {"navigate", "navigate_and_search", "search", "back", "forward", "refresh", "chain"}
+
+# Most elements reported per DOM structure category, prompts only use the first 10
+DOM_ELEMENT_LIMIT = 20
+
+# Collects buttons, links, form fields, content sections and navigation in one evaluate call
+DOM_STRUCTURE_JS = """
+(limit) => {
+    const isVisible = el => el.offsetParent !== null;
+    const classesOf = el => Array.from(el.classList).join(' ');
+    // textContent doesn't force a layout like innerText, collapse its raw whitespace instead
+    const textOf = el => (el.textContent || '').replace(/\s+/g, ' ').trim();
+    // Map matching elements until limit items are kept, skipping those the mapper returns null for
+    const collect = (selector, mapper, root = document) => {
+        const items = [];
+        for (const el of root.querySelectorAll(selector)) {
+            const item = mapper(el);
+            if (item !== null) {
+                items.push(item);
+                if (items.length >= limit) break;
+            }
+        }
+        return items;
+    };
+
+    const buttons = collect('button, [role="button"], .btn, input[type="button"], input[type="submit"]', el => {
+        const text = textOf(el) || (el.value || '').trim();
+        if (text === '') return null;
+        const rect = el.getBoundingClientRect();
+        return {
+            text: text,
+            visible: isVisible(el),
+            disabled: el.disabled || false,
+            location: {x: rect.x, y: rect.y}
+        };
+    });
+
+    const links = collect('a[href]', el => {
+        const text = textOf(el);
+        if (text === '') return null;
+        const rect = el.getBoundingClientRect();
+        return {
+            text: text,
+            href: el.href,
+            visible: isVisible(el),
+            location: {x: rect.x, y: rect.y}
+        };
+    });
+
+    const formFields = collect('input:not([type="hidden"]), textarea, select', el => {
+        const label = el.labels && el.labels.length > 0
+            ? textOf(el.labels[0])
+            : '';
+        return {
+            type: el.type || el.tagName.toLowerCase(),
+            name: el.name || '',
+            id: el.id || '',
+            placeholder: el.placeholder || '',
+            label: label,
+            value: el.value || '',
+            visible: isVisible(el),
+            disabled: el.disabled || false
+        };
+    });
+
+    const contentSections = collect('main, [role="main"], article, section, .content, #content, .main, #main', el => ({
+        tag: el.tagName.toLowerCase(),
+        id: el.id || '',
+        classes: classesOf(el),
+        text_sample: textOf(el).substring(0, 100) + '...',
+        children_count: el.children.length
+    }));
+
+    const navigation = collect('nav, [role="navigation"], .nav, #nav, .navigation, #navigation, .menu, #menu', el => ({
+        tag: el.tagName.toLowerCase(),
+        id: el.id || '',
+        classes: classesOf(el),
+        items: collect('a, button', item => textOf(item) || null, el)
+    }));
+
+    return {
+        buttons: buttons,
+        links: links,
+        form_fields: formFields,
+        content_sections: contentSections,
+        navigation: navigation
+    };
+}
+"""
+
 class BrowserAgent:
     """Agent that can interpret natural language commands for browser automation."""
     
@@ -43,10 +245,26 @@ class BrowserAgent:
         self.page = page
         self.browser = browser
         self.browser_context = browser_context
-        self.last_screenshot = None
+        self.last_screenshot_bytes = None
+        self._last_screenshot = None
+        self._pending_writes = set()
         self.last_html = None
-        self.memory = []
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.last_dom_structure = None
+        self._main_content = ""
+        self._main_content_html_hash = None
+        # Oldest steps drop off once the limit is reached, keeping prompts small
+        self.memory = deque(maxlen=MEMORY_SIZE)
+        self._memory_summary = None
+        self._refine_cache = OrderedDict()
+        # Async client so model calls don't block the event loop while the browser works
+        self.client = _get_client()
+        
+    @property
+    def last_screenshot(self) -> Optional[Image.Image]:
+        """The last screenshot as a PIL image, decoded on first access."""
+        if self._last_screenshot is None and self.last_screenshot_bytes:
+            self._last_screenshot = Image.open(io.BytesIO(self.last_screenshot_bytes))
+        return self._last_screenshot
         
     def set_browser_objects(self, page, browser=None, browser_context=None):
         """Set the browser objects for this agent."""
@@ -57,30 +275,33 @@ class BrowserAgent:
     def add_to_memory(self, step_info: Dict[str, Any]) -> None:
         """Add a step to the agent's memory."""
         self.memory.append(step_info)
-        # Limit memory size to prevent token issues
-        if len(self.memory) > 20:
-            # Keep first steps and most recent ones
-            self.memory = self.memory[:5] + self.memory[-15:]
+        self._memory_summary = None
+        if step_info.get("action") in PAGE_CHANGING_ACTIONS:
+            self.last_dom_structure = None
+            self._main_content_html_hash = None
         
     def get_memory_summary(self) -> str:
         """Generate a summary of the agent's memory for context."""
         if not self.memory:
             return "No previous actions."
-            
-        summary = "Previous actions:\n"
-        for i, step in enumerate(self.memory):
-            if "action" in step:
-                details = ""
-                if "url" in step:
-                    details += f" URL: {step['url']}"
-                if "query" in step:
-                    details += f" Query: \"{step['query']}\""
-                if "description" in step:
-                    details += f" Target: \"{step['description']}\""
-                
-                summary += f"{i+1}. {step['action'].replace('_', ' ').title()}{details}\n"
         
-        return summary
+        # Memory only changes in add_to_memory, which clears the cached summary
+        if self._memory_summary is None:
+            lines = ["Previous actions:\n"]
+            for i, step in enumerate(self.memory):
+                if "action" in step:
+                    details = []
+                    if "url" in step:
+                        details.append(f" URL: {step['url']}")
+                    if "query" in step:
+                        details.append(f" Query: \"{step['query']}\"")
+                    if "description" in step:
+                        details.append(f" Target: \"{step['description']}\"")
+                    
+                    lines.append(f"{i+1}. {step['action'].replace('_', ' ').title()}{''.join(details)}\n")
+            self._memory_summary = "".join(lines)
+        
+        return self._memory_summary
         
     async def take_screenshot(self, save_to_file=True):
         """Take a screenshot of the current page asynchronously."""
@@ -89,172 +310,215 @@ class BrowserAgent:
             return False
             
         try:
-            screenshot_bytes = await self.page.screenshot()
-            self.last_screenshot = Image.open(io.BytesIO(screenshot_bytes))
+            # Screenshots that are not kept on disk only feed the Vision API, so send a smaller JPEG
+            screenshot_options = {} if save_to_file else {"type": "jpeg", "quality": SCREENSHOT_JPEG_QUALITY}
+            
+            # Capture the image, HTML and DOM structure concurrently
+            screenshot_bytes, html, dom_structure = await asyncio.gather(
+                self.page.screenshot(**screenshot_options),
+                self.page.content(),
+                self.extract_dom_structure(),
+                return_exceptions=True
+            )
+            if isinstance(screenshot_bytes, Exception):
+                raise screenshot_bytes
+            # Keep the encoded bytes, the PIL image is only decoded if something needs it
+            self.last_screenshot_bytes = screenshot_bytes
+            self._last_screenshot = None
             
             # Also capture HTML for context
-            try:
-                self.last_html = await self.page.content()
-            except Exception as e:
-                logger.error(f"Error capturing HTML: {str(e)}")
-                self.last_html = None
+            if isinstance(html, Exception):
+                logger.error(f"Error capturing HTML: {str(html)}")
+                html = None
+            self.last_html = html
             
             # Extract DOM structure for better context
-            try:
-                self.last_dom_structure = await self.extract_dom_structure()
-            except Exception as e:
-                logger.error(f"Error extracting DOM structure: {str(e)}")
-                self.last_dom_structure = None
+            if isinstance(dom_structure, Exception):
+                logger.error(f"Error extracting DOM structure: {str(dom_structure)}")
+                dom_structure = None
+            self.last_dom_structure = dom_structure
             
             if save_to_file:
-                # Save screenshot to file
+                # Save screenshot to file in a worker thread, without waiting for the write
                 timestamp = int(time.time())
-                screenshots_dir = Path("screenshots")
-                screenshots_dir.mkdir(exist_ok=True)
-                
-                filename = screenshots_dir / f"screenshot_{timestamp}.png"
-                self.last_screenshot.save(filename)
-                logger.info(f"Screenshot saved to: {filename}")
+                filename = Path("screenshots") / f"screenshot_{timestamp}.png"
+                task = asyncio.create_task(asyncio.to_thread(self._save_screenshot, filename, screenshot_bytes))
+                self._pending_writes.add(task)
+                task.add_done_callback(self._pending_writes.discard)
                 
             return True
         except Exception as e:
             logger.error(f"Error taking screenshot: {str(e)}")
             return False
     
+    def _save_screenshot(self, filename: Path, screenshot_bytes: bytes) -> None:
+        """Write screenshot bytes to disk, run off the event loop."""
+        try:
+            filename.parent.mkdir(exist_ok=True)
+            filename.write_bytes(screenshot_bytes)
+            logger.info(f"Screenshot saved to: {filename}")
+        except Exception as e:
+            logger.error(f"Error saving screenshot: {str(e)}")
+    
+    async def wait_for_pending_writes(self) -> None:
+        """Wait for screenshots still being written to disk."""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes)
+    
     async def extract_dom_structure(self) -> Dict[str, Any]:
         """Extract key elements from the DOM for better context."""
         if not self.page:
             return {}
             
         try:
-            # Extract main structural elements
-            structure = {}
-            
-            # Get page metadata
-            structure["metadata"] = {
-                "url": self.page.url,
-                "title": await self.page.title()
-            }
-            
-            # Extract all buttons and links with their text
-            buttons_js = """
-            Array.from(document.querySelectorAll('button, [role="button"], .btn, input[type="button"], input[type="submit"]'))
-            .map(el => {
-                return {
-                    text: el.innerText || el.textContent || el.value || '',
-                    visible: el.offsetParent !== null,
-                    disabled: el.disabled || false,
-                    location: {
-                        x: el.getBoundingClientRect().x,
-                        y: el.getBoundingClientRect().y
-                    }
-                }
-            }).filter(b => b.text.trim() !== '')
-            """
-            structure["buttons"] = await self.page.evaluate(buttons_js)
-            
-            # Extract all links with their text and href
-            links_js = """
-            Array.from(document.querySelectorAll('a[href]'))
-            .map(el => {
-                return {
-                    text: el.innerText || el.textContent || '',
-                    href: el.href,
-                    visible: el.offsetParent !== null,
-                    location: {
-                        x: el.getBoundingClientRect().x,
-                        y: el.getBoundingClientRect().y
-                    }
-                }
-            }).filter(l => l.text.trim() !== '')
-            """
-            structure["links"] = await self.page.evaluate(links_js)
-            
-            # Extract all form fields
-            fields_js = """
-            Array.from(document.querySelectorAll('input:not([type="hidden"]), textarea, select'))
-            .map(el => {
-                const label = el.labels && el.labels.length > 0 
-                    ? el.labels[0].innerText || el.labels[0].textContent 
-                    : '';
-                return {
-                    type: el.type || el.tagName.toLowerCase(),
-                    name: el.name || '',
-                    id: el.id || '',
-                    placeholder: el.placeholder || '',
-                    label: label,
-                    value: el.value || '',
-                    visible: el.offsetParent !== null,
-                    disabled: el.disabled || false
-                }
-            })
-            """
-            structure["form_fields"] = await self.page.evaluate(fields_js)
-            
-            # Extract main content sections
-            sections_js = """
-            Array.from(document.querySelectorAll('main, [role="main"], article, section, .content, #content, .main, #main'))
-            .map(el => {
-                return {
-                    tag: el.tagName.toLowerCase(),
-                    id: el.id || '',
-                    classes: Array.from(el.classList).join(' '),
-                    text_sample: (el.innerText || el.textContent || '').substring(0, 100) + '...',
-                    children_count: el.children.length
-                }
-            })
-            """
-            structure["content_sections"] = await self.page.evaluate(sections_js)
-            
-            # Extract navigation elements
-            nav_js = """
-            Array.from(document.querySelectorAll('nav, [role="navigation"], .nav, #nav, .navigation, #navigation, .menu, #menu'))
-            .map(el => {
-                return {
-                    tag: el.tagName.toLowerCase(),
-                    id: el.id || '',
-                    classes: Array.from(el.classList).join(' '),
-                    items: Array.from(el.querySelectorAll('a, button')).map(item => item.innerText || item.textContent || '').filter(text => text.trim() !== '')
+            # Walk the DOM in a single script while the title is fetched alongside it
+            title, elements = await asyncio.gather(
+                self.page.title(),
+                self.page.evaluate(DOM_STRUCTURE_JS, DOM_ELEMENT_LIMIT)
+            )
+            structure = {
+                "metadata": {
+                    "url": self.page.url,
+                    "title": title
                 }
-            })
-            """
-            structure["navigation"] = await self.page.evaluate(nav_js)
-            
+            }
+            structure.update(elements)
             return structure
             
         except Exception as e:
             logger.error(f"Error extracting DOM structure: {str(e)}")
             return {}
     
+    async def get_dom_structure(self) -> Dict[str, Any]:
+        """Return the DOM structure captured with the last screenshot, extracting it if missing."""
+        if self.last_dom_structure:
+            return self.last_dom_structure
+        return await self.extract_dom_structure() if self.page else {}
+    
+    async def get_page_metadata(self) -> Dict[str, str]:
+        """Get the current page URL and title, or an empty dict if unavailable."""
+        if not self.page:
+            return {}
+            
+        try:
+            return {
+                "url": self.page.url,
+                "title": await self.page.title()
+            }
+        except Exception:
+            return {}
+    
     async def extract_main_content(self) -> str:
         """Extract the main content text from the page using heuristics."""
-        if not self.page or not self.last_html:
+        if not self.page and not self.last_html:
             return ""
             
+        # Reuse the text extracted for the same HTML snapshot
+        html_hash = hash(self.last_html) if self.last_html else None
+        if html_hash is not None and html_hash == self._main_content_html_hash:
+            return self._main_content
+            
         try:
-            # Parse the HTML
-            soup = BeautifulSoup(self.last_html, 'html.parser')
+            main_content = await self._read_main_content()
+        except Exception as e:
+            logger.error(f"Error extracting main content: {str(e)}")
+            return ""
             
-            # Remove script, style, and hidden elements
-            for element in soup(['script', 'style', 'head', 'header', 'footer', '[style*="display:none"]', '[style*="display: none"]']):
-                element.decompose()
+        self._main_content_html_hash = html_hash
+        self._main_content = main_content
+        return main_content
+    
+    async def _read_main_content(self) -> str:
+        """Read the main content text from the live page, or from the captured HTML without one."""
+        if self.page:
+            # The browser already has the DOM, read the text there instead of parsing the HTML
+            return await self.page.evaluate(MAIN_CONTENT_JS, [MAIN_CONTENT_SELECTORS, MAIN_CONTENT_MAX_CHARS])
             
-            # Look for main content areas in priority order
-            for selector in ['main', '[role="main"]', 'article', '#content', '.content', '#main', '.main', 'section']:
-                main_content = soup.select(selector)
-                if main_content:
-                    return main_content[0].get_text(separator='\n', strip=True)
+        # Parse the HTML with lxml, skipping everything outside the body
+        soup = BeautifulSoup(self.last_html, 'lxml', parse_only=MAIN_CONTENT_STRAINER)
+        
+        # Remove script, style, header and footer elements nested in the kept content
+        for element in soup(['script', 'style', 'header', 'footer']):
+            element.decompose()
+        
+        # Look for main content areas in priority order
+        for selector in MAIN_CONTENT_SELECTORS:
+            main_content = soup.select_one(selector)
+            if main_content:
+                return main_content.get_text(separator='\n', strip=True)
+        
+        # Fall back to body content if no main content area found
+        return soup.body.get_text(separator='\n', strip=True)
+    
+    def format_dom_info(self, dom_structure: Dict[str, Any]) -> str:
+        """Format the key interactive elements of a DOM structure for a prompt."""
+        if not dom_structure:
+            return ""
             
-            # Fall back to body content if no main content area found
-            return soup.body.get_text(separator='\n', strip=True)
+        lines = []
+        if dom_structure.get("buttons"):
+            lines.append("\nButtons on the page:\n")
+            lines.extend(
+                f"- {btn['text']} {'(disabled)' if btn['disabled'] else ''}\n"
+                for btn in dom_structure["buttons"][:10]  # Limit to 10 buttons
+            )
+        
+        if dom_structure.get("links"):
+            lines.append("\nKey links:\n")
+            lines.extend(
+                f"- {link['text']} ({link['href']})\n"
+                for link in dom_structure["links"][:10]  # Limit to 10 links
+            )
+        
+        if dom_structure.get("form_fields"):
+            lines.append("\nForm fields:\n")
+            lines.extend(
+                f"- {field['label'] or field['placeholder'] or field['name'] or field['id']} ({field['type']})\n"
+                for field in dom_structure["form_fields"][:10]  # Limit to 10 fields
+            )
+        
+        return "".join(lines)
+    
+    def encode_screenshot_for_vision(self, detail: str = "high") -> Tuple[str, str]:
+        """
+        Encode the last screenshot for the Vision API.
+        
+        Args:
+            detail: The Vision API detail level the image will be sent with
             
-        except Exception as e:
-            logger.error(f"Error extracting main content: {str(e)}")
-            return ""
+        Returns:
+            A tuple of (image type, base64 string)
+        """
+        max_dim = VISION_MAX_DIMENSIONS.get(detail, VISION_MAX_DIMENSIONS["high"])
+        # Opening only reads the header, pixels are decoded below if the image must be re-encoded.
+        # A local image is used so the decoded pixels are freed once encoding is done.
+        image = Image.open(io.BytesIO(self.last_screenshot_bytes))
+        
+        # Small JPEG captures can be sent as they are
+        if image.format == "JPEG" and max(image.size) <= max_dim:
+            return "jpeg", binascii.b2a_base64(self.last_screenshot_bytes, newline=False).decode("ascii")
+            
+        # JPEGs can be decoded straight at a reduced scale
+        if image.format == "JPEG":
+            image.draft("RGB", (max_dim, max_dim))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+            
+        # Downscale and re-encode as a compact JPEG
+        image.thumbnail((max_dim, max_dim), Image.LANCZOS)
+        buffered = io.BytesIO()
+        image.save(buffered, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        # Encode straight from the buffer's memory instead of copying it out with getvalue()
+        return "jpeg", binascii.b2a_base64(buffered.getbuffer(), newline=False).decode("ascii")
     
-    async def analyze_with_vision(self):
-        """Analyze the current page with OpenAI's Vision API."""
-        if not self.last_screenshot:
+    async def analyze_with_vision(self, detail: str = "high"):
+        """
+        Analyze the current page with OpenAI's Vision API.
+        
+        Args:
+            detail: Vision API detail level, "low" sends a smaller image when only the coarse layout matters
+        """
+        if not self.last_screenshot_bytes:
             logger.error("No screenshot available")
             if self.page:
                 await self.take_screenshot()
@@ -268,45 +532,20 @@ class BrowserAgent:
                 logger.error("OpenAI API key not found. Set the OPENAI_API_KEY environment variable.")
                 return False
                 
-            # Get page metadata for context
-            page_metadata = {}
-            if self.page:
-                try:
-                    page_metadata = {
-                        "url": self.page.url,
-                        "title": await self.page.title()
-                    }
-                except:
-                    pass
-            
-            # Convert image to base64
-            buffered = io.BytesIO()
-            self.last_screenshot.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            
-            # Extract DOM structure information
-            dom_info = ""
-            dom_structure = await self.extract_dom_structure() if self.page else {}
-            if dom_structure:
-                # Format key interactive elements
-                if "buttons" in dom_structure and dom_structure["buttons"]:
-                    dom_info += "\nButtons on the page:\n"
-                    for i, btn in enumerate(dom_structure["buttons"][:10]):  # Limit to 10 buttons
-                        dom_info += f"- {btn['text']} {'(disabled)' if btn['disabled'] else ''}\n"
-                
-                if "links" in dom_structure and dom_structure["links"]:
-                    dom_info += "\nKey links:\n"
-                    for i, link in enumerate(dom_structure["links"][:10]):  # Limit to 10 links
-                        dom_info += f"- {link['text']} ({link['href']})\n"
-                
-                if "form_fields" in dom_structure and dom_structure["form_fields"]:
-                    dom_info += "\nForm fields:\n"
-                    for i, field in enumerate(dom_structure["form_fields"][:10]):  # Limit to 10 fields
-                        field_desc = field['label'] or field['placeholder'] or field['name'] or field['id']
-                        dom_info += f"- {field_desc} ({field['type']})\n"
-            
-            # Extract main content text
-            main_content = await self.extract_main_content() if self.last_html else ""
+            # Gather page metadata, DOM structure and main content concurrently
+            page_metadata, dom_structure, main_content = await asyncio.gather(
+                self.get_page_metadata(),
+                self.get_dom_structure(),
+                self.extract_main_content()
+            )
+            
+            # Encode the screenshot at a size the Vision API can use
+            img_type, img_str = self.encode_screenshot_for_vision(detail)
+            
+            # Format DOM structure information
+            dom_info = self.format_dom_info(dom_structure)
+            
+            # Trim main content text
             content_snippet = main_content[:1000] + "..." if len(main_content) > 1000 else main_content
             
             # Prepare prompt with enhanced context
@@ -333,20 +572,24 @@ Please provide a detailed analysis of the page in the following structured forma
 Your analysis should help a user understand what they're looking at and what they can do next.
 """
             
+            prompt_parts = [prompt]
+            
             if page_metadata:
-                prompt += f"\n\nPage URL: {page_metadata.get('url')}"
-                prompt += f"\nPage Title: {page_metadata.get('title')}"
+                prompt_parts.append(f"\n\nPage URL: {page_metadata.get('url')}")
+                prompt_parts.append(f"\nPage Title: {page_metadata.get('title')}")
             
             if dom_info:
-                prompt += f"\n\n{dom_info}"
+                prompt_parts.append(f"\n\n{dom_info}")
                 
             if content_snippet:
-                prompt += f"\n\nContent extract:\n{content_snippet}"
+                prompt_parts.append(f"\n\nContent extract:\n{content_snippet}")
                 
             # Memory summary for context
             memory_summary = self.get_memory_summary()
             if memory_summary:
-                prompt += f"\n\n{memory_summary}"
+                prompt_parts.append(f"\n\n{memory_summary}")
+                
+            prompt = "".join(prompt_parts)
                 
             # Initialize OpenAI client
             client = self.client
@@ -354,7 +597,7 @@ Your analysis should help a user understand what they're looking at and what the
             logger.info("Analyzing page with OpenAI Vision API...")
             
             # Call the API
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {
@@ -371,8 +614,8 @@ Your analysis should help a user understand what they're looking at and what the
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{img_str}",
-                                    "detail": "high"
+                                    "url": f"data:image/{img_type};base64,{img_str}",
+                                    "detail": detail
                                 }
                             }
                         ]
@@ -463,12 +706,15 @@ Available actions:
 - "handle_dialog": Handle browser dialogs (alerts, confirms, prompts)
   Parameters: "dialog_action" ("accept" or "dismiss"), "prompt_text" (optional string)
 
+- "chain": Run several simple steps back to back, with a single screenshot at the end
+  Parameters: "steps" (array of step objects)
+
 Return a JSON array of steps, where each step has an "action" property and any required parameters for that action.
 Also include a "description" property for each step that explains its purpose.
 """
 
             # Get the plan from OpenAI
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": "You are a browser automation expert that outputs detailed, practical plans in JSON format."},
@@ -482,7 +728,7 @@ Also include a "description" property for each step that explains its purpose.
             result = response.choices[0].message.content
             
             # The result should be a JSON string
-            plan_data = json.loads(result)
+            plan_data = orjson.loads(result)
             
             # Extract the plan array
             if "plan" in plan_data:
@@ -512,7 +758,7 @@ Also include a "description" property for each step that explains its purpose.
         
         Args:
             step: The original plan step
-            page_info: Information about the current page
+            page_info: Information about the current page (url, title and optionally dom_structure)
             
         Returns:
             An updated step with more specific details
@@ -522,26 +768,18 @@ Also include a "description" property for each step that explains its purpose.
             current_url = page_info.get("url", "")
             page_title = page_info.get("title", "")
             
+            # The same step on the same page was refined before, skip the model call
+            cache_key = (orjson.dumps(step, option=orjson.OPT_SORT_KEYS), current_url)
+            cached_step = self._refine_cache.get(cache_key)
+            if cached_step is not None:
+                self._refine_cache.move_to_end(cache_key)
+                return dict(cached_step)
+            
             # Get DOM structure for context if we have a page
-            dom_info = ""
-            dom_structure = await self.extract_dom_structure() if self.page else {}
-            if dom_structure:
-                # Format key interactive elements
-                if "buttons" in dom_structure and dom_structure["buttons"]:
-                    dom_info += "\nButtons on the page:\n"
-                    for i, btn in enumerate(dom_structure["buttons"][:10]):  # Limit to 10 buttons
-                        dom_info += f"- {btn['text']} {'(disabled)' if btn['disabled'] else ''}\n"
-                
-                if "links" in dom_structure and dom_structure["links"]:
-                    dom_info += "\nKey links:\n"
-                    for i, link in enumerate(dom_structure["links"][:10]):  # Limit to 10 links
-                        dom_info += f"- {link['text']} ({link['href']})\n"
-                
-                if "form_fields" in dom_structure and dom_structure["form_fields"]:
-                    dom_info += "\nForm fields:\n"
-                    for i, field in enumerate(dom_structure["form_fields"][:10]):  # Limit to 10 fields
-                        field_desc = field['label'] or field['placeholder'] or field['name'] or field['id']
-                        dom_info += f"- {field_desc} ({field['type']})\n"
+            dom_structure = page_info.get("dom_structure")
+            if dom_structure is None:
+                dom_structure = await self.get_dom_structure()
+            dom_info = self.format_dom_info(dom_structure)
             
             # Construct a prompt for refining the step
             prompt = f"""
@@ -556,7 +794,7 @@ You are an expert in browser automation. Your task is to refine a planned action
 
 ## Original Planned Step
 ```
-{json.dumps(step, indent=2)}
+{orjson.dumps(step, option=orjson.OPT_INDENT_2).decode()}
 ```
 
 ## Instructions
@@ -571,7 +809,7 @@ Return a refined step as a JSON object that includes the action and any necessar
 """
 
             # Get the refined step from OpenAI
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": "You are a precise browser automation expert that outputs only valid JSON."},
@@ -583,303 +821,271 @@ Return a refined step as a JSON object that includes the action and any necessar
             
             # Parse the response
             result = response.choices[0].message.content
-            refined_step = json.loads(result)
+            refined_step = orjson.loads(result)
             
-            logger.info(f"Original step: {step}")
-            logger.info(f"Refined step: {refined_step}")
+            logger.info("Original step: %s", step)
+            logger.info("Refined step: %s", refined_step)
             
             # Add explanation if available
             if "explanation" in refined_step:
-                logger.info(f"Refinement explanation: {refined_step.get('explanation')}")
+                logger.info("Refinement explanation: %s", refined_step.get("explanation"))
                 # Remove explanation from step definition to avoid confusion in execution
                 if "explanation" in refined_step:
                     explanation = refined_step.pop("explanation")
             
-            return refined_step
+            self._refine_cache[cache_key] = refined_step
+            if len(self._refine_cache) > REFINE_CACHE_SIZE:
+                self._refine_cache.popitem(last=False)
+            return dict(refined_step)
             
         except Exception as e:
             logger.error(f"Error refining plan step: {str(e)}")
             return step  # Return the original step if refinement fails
     
-    async def process_command(self, command):
-        """Process a natural language command."""
-        if not command:
-            return False
-            
-        command = command.lower().strip()
+    def _site_url(self, match: re.Match) -> str:
+        """Build the URL for a site named in a "go to X and search" style command."""
+        site_name = match.group("site")
         
+        # Check if the site_name already contains a domain suffix
+        if "." in site_name:
+            return f"https://{site_name}"
+        # Otherwise apply the appropriate domain
+        if ".in" in match.group(0):
+            return f"https://{site_name}.in"
+        if ".co.uk" in match.group(0):
+            return f"https://{site_name}.co.uk"
+        if ".co" in match.group(0):
+            return f"https://{site_name}.co"
+        return f"https://{site_name}.com"
+    
+    def _parse_go(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse commands starting with "go"."""
+        go_match = GO_RE.match(command)
+        if not go_match:
+            return None
+            
         # Parse "go to X and search for Y" format
-        go_to_and_search_match = re.match(r"go\s+to\s+([a-z0-9.-]+)(?:\.com|\.org|\.net|\.in|\.co|\.io)?\s+and\s+search\s+for\s+(.*)", command)
-        if go_to_and_search_match:
-            site_name = go_to_and_search_match.group(1)
-            search_query = go_to_and_search_match.group(2).strip()
-            
-            # Construct the URL based on the site name
-            site_url = f"https://{site_name}.com"
-            
-            # Check if the site_name already contains a domain suffix
-            if "." in site_name:
-                site_url = f"https://{site_name}"
-            # Otherwise apply the appropriate domain
-            elif ".in" in go_to_and_search_match.group(0):
-                site_url = f"https://{site_name}.in"
-            elif ".co.uk" in go_to_and_search_match.group(0):
-                site_url = f"https://{site_name}.co.uk"
-            elif ".co" in go_to_and_search_match.group(0):
-                site_url = f"https://{site_name}.co"
-            
-            result = {
+        if go_match.group("site") is not None:
+            return {
                 "action": "navigate_and_search",
-                "url": site_url,
-                "query": search_query
+                "url": self._site_url(go_match),
+                "query": go_match.group("query")
             }
-            self.add_to_memory(result)
-            return result
-        
-        # Parse "on X search for Y" format
-        on_site_search_match = re.match(r"on\s+([a-z0-9.-]+)(?:\.com|\.org|\.net|\.in|\.co|\.io)?\s+search\s+for\s+(.*)", command)
+        return self._navigate_result(go_match.group("url"))
+    
+    def _parse_on(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "on X search for Y" commands."""
+        on_site_search_match = ON_SITE_SEARCH_RE.match(command)
         if on_site_search_match:
-            site_name = on_site_search_match.group(1)
-            search_query = on_site_search_match.group(2).strip()
-            
-            # Construct URL
-            site_url = f"https://{site_name}.com"
-            
-            # Check if the site_name already contains a domain suffix
-            if "." in site_name:
-                site_url = f"https://{site_name}"
-            # Apply the appropriate domain
-            elif ".in" in on_site_search_match.group(0):
-                site_url = f"https://{site_name}.in"
-            elif ".co.uk" in on_site_search_match.group(0):
-                site_url = f"https://{site_name}.co.uk"
-            elif ".co" in on_site_search_match.group(0):
-                site_url = f"https://{site_name}.co"
-            
-            result = {
+            return {
                 "action": "navigate_and_search",
-                "url": site_url,
-                "query": search_query
+                "url": self._site_url(on_site_search_match),
+                "query": on_site_search_match.group("query")
             }
-            self.add_to_memory(result)
-            return result
-        
-        # Search command
-        search_match = re.match(r"(search|find)\s+(?:for\s+)?(.*)", command)
+        return None
+    
+    def _parse_search(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "search for X" and "find X" commands."""
+        search_match = SEARCH_RE.match(command)
         if search_match:
-            query = search_match.group(2).strip()
+            query = search_match.group(2)
             
             # Check if we're already on a searchable site
             search_on_current = False
             
             if self.page:
-                current_url = self.page.url.lower()
-                search_on_current = any(site in current_url for site in is_known_searchable_site(current_url))
+                search_on_current = is_known_searchable_site(self.page.url)
             
             if search_on_current:
-                result = {
+                return {
                     "action": "search",
                     "query": query
                 }
-            else:
-                # Default to Google search
-                result = {
-                    "action": "navigate",
-                    "url": f"https://www.google.com/search?q={'+'.join(query.split())}"
-                }
-                
-            self.add_to_memory(result)
-            return result
-            
-        # Open/go to URL command
-        open_match = re.match(r"(open|go\s+to)\s+(.*)", command)
-        if open_match:
-            url = open_match.group(2).strip()
-            
-            # If it's just a domain without http://, add https://
-            if not url.startswith(("http://", "https://")):
-                # Check if it has a TLD
-                if not any(url.endswith(tld) for tld in [".com", ".org", ".net", ".io", ".gov", ".edu", ".co", ".in"]):
-                    # If no TLD, assume .com
-                    if "." not in url:
-                        url = f"{url}.com"
-                url = f"https://{url}"
-                
-            result = {
+            # Default to Google search
+            return {
                 "action": "navigate",
-                "url": url
+                "url": f"https://www.google.com/search?q={quote_plus(query)}"
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Navigation commands
-        if command in ["back", "go back"]:
-            result = {"action": "back"}
-            self.add_to_memory(result)
-            return result
-            
-        if command in ["forward", "go forward"]:
-            result = {"action": "forward"}
-            self.add_to_memory(result)
-            return result
-            
-        if command in ["refresh", "reload"]:
-            result = {"action": "refresh"}
-            self.add_to_memory(result)
-            return result
-            
-        # Click commands
-        click_match = re.match(r"click\s+(?:on\s+)?(?:the\s+)?(?:button\s+)?(?:link\s+)?(?:with\s+text\s+)?[\"']?([^\"']+)[\"']?", command)
+        
+        # Find text
+        find_text_match = FIND_TEXT_RE.match(command)
+        if find_text_match:
+            return {
+                "action": "find_text",
+                "query": find_text_match.group(1)
+            }
+        return None
+    
+    def _parse_open(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "open X" commands."""
+        open_match = OPEN_RE.match(command)
+        if not open_match:
+            return None
+        return self._navigate_result(open_match.group("url"))
+    
+    def _navigate_result(self, url: str) -> Dict[str, Any]:
+        """Build a navigate result for a URL or bare domain from an "open"/"go to" command."""
+        # If it's just a domain without http://, add https://
+        if not url.startswith(("http://", "https://")):
+            # Check if it has a TLD
+            if not TLD_RE.search(url):
+                # If no TLD, assume .com
+                if "." not in url:
+                    url = f"{url}.com"
+            url = f"https://{url}"
+            
+        return {
+            "action": "navigate",
+            "url": url
+        }
+    
+    def _parse_click(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse click commands."""
+        click_match = CLICK_RE.match(command)
         if click_match:
-            text = click_match.group(1).strip()
-            result = {
+            return {
                 "action": "smart_click",
-                "description": text
+                "description": click_match.group(1)
             }
-            self.add_to_memory(result)
-            return result
             
         # Click selector
-        click_selector_match = re.match(r"click\s+(?:on\s+)?(?:the\s+)?(?:element\s+with\s+)?(?:selector|css)\s+[\"']?([^\"']+)[\"']?", command)
+        click_selector_match = CLICK_SELECTOR_RE.match(command)
         if click_selector_match:
-            selector = click_selector_match.group(1).strip()
-            result = {
+            return {
                 "action": "click_selector",
-                "selector": selector
+                "selector": click_selector_match.group(1)
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Select first item
-        select_first_match = re.match(r"select\s+(?:the\s+)?first\s+(?:item|result)(?:\s+with\s+(.+))?", command)
+        return None
+    
+    def _parse_select(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "select first item" commands."""
+        select_first_match = SELECT_FIRST_RE.match(command)
         if select_first_match:
-            terms = select_first_match.group(1).strip() if select_first_match.group(1) else None
-            result = {
+            if not select_first_match.group(1):
+                return SELECT_FIRST_ANY_RESULT
+            return {
                 "action": "select_first_item",
-                "query_terms": terms
+                "query_terms": select_first_match.group(1)
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Type text in field
-        type_match = re.match(r"type\s+[\"']?([^\"']+)[\"']?\s+in(?:to)?\s+(?:the\s+)?[\"']?([^\"']+)[\"']?(?:\s+field)?", command)
+        return None
+    
+    def _parse_type(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "type X in Y" commands."""
+        type_match = TYPE_RE.match(command)
         if type_match:
-            text = type_match.group(1).strip()
-            field = type_match.group(2).strip()
-            result = {
+            return {
                 "action": "fill_form",
-                "value": text,
-                "field": field
+                "value": type_match.group(1),
+                "field": type_match.group(2)
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Submit form
-        if re.match(r"submit(?:\s+form)?", command):
-            result = {"action": "submit_form"}
-            self.add_to_memory(result)
-            return result
-            
-        # Scroll commands
-        scroll_match = re.match(r"scroll\s+(up|down)(?:\s+(\d+))?", command)
+        return None
+    
+    def _parse_submit(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "submit" and "submit form" commands."""
+        return SUBMIT_FORM_RESULT
+    
+    def _parse_scroll(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse scroll commands."""
+        scroll_match = SCROLL_RE.match(command)
         if scroll_match:
-            direction = scroll_match.group(1)
-            amount = int(scroll_match.group(2)) if scroll_match.group(2) else 300
-            result = {
+            return {
                 "action": "scroll",
-                "direction": direction,
-                "amount": amount
-            }
-            self.add_to_memory(result)
-            return result
-            
-        # Find text
-        find_text_match = re.match(r"find\s+(?:text\s+)?[\"']?([^\"']+)[\"']?(?:\s+on\s+(?:the\s+)?page)?", command)
-        if find_text_match:
-            text = find_text_match.group(1).strip()
-            result = {
-                "action": "find_text",
-                "query": text
+                "direction": scroll_match.group(1),
+                "amount": int(scroll_match.group(2)) if scroll_match.group(2) else 300
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Screenshot
-        if command in ["screenshot", "take screenshot", "capture"]:
-            result = {"action": "screenshot"}
-            self.add_to_memory(result)
-            return result
-            
-        # Analyze
-        if command in ["analyze", "analyze page", "what's on this page", "what is on this page"]:
-            result = {"action": "analyze"}
-            self.add_to_memory(result)
-            return result
-            
-        # Run JavaScript
-        js_match = re.match(r"(?:run|execute)\s+(?:js|javascript)\s+(.+)", command)
+        return None
+    
+    def _parse_run_js(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "run js X" commands."""
+        js_match = RUN_JS_RE.match(command)
         if js_match:
-            code = js_match.group(1).strip()
-            result = {
+            return {
                 "action": "run_js",
-                "code": code
+                "code": js_match.group(1)
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Extract data
-        if command in ["extract data", "extract info", "get data", "extract"]:
-            result = {"action": "extract_data"}
-            self.add_to_memory(result)
-            return result
-            
-        # Wait commands
-        wait_for_match = re.match(r"wait\s+for\s+(.+)", command)
-        if wait_for_match:
-            selector = wait_for_match.group(1).strip()
-            result = {
+        return None
+    
+    def _parse_wait(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse "wait for X" and "wait N seconds" commands."""
+        # Plain "wait N" is the common form and needs no pattern
+        seconds = command[5:]
+        if command.startswith("wait ") and seconds.isdecimal():
+            return {
                 "action": "wait",
-                "selector": selector
+                "seconds": int(seconds)
             }
-            self.add_to_memory(result)
-            return result
             
-        wait_seconds_match = re.match(r"wait\s+(\d+)(?:\s+seconds)?", command)
-        if wait_seconds_match:
-            seconds = int(wait_seconds_match.group(1))
-            result = {
+        wait_match = WAIT_RE.match(command)
+        if not wait_match:
+            return None
+            
+        if wait_match.group("selector") is not None:
+            return {
                 "action": "wait",
-                "seconds": seconds
+                "selector": wait_match.group("selector")
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Dialog handling
-        dialog_match = re.match(r"(accept|dismiss|handle)\s+(?:the\s+)?(dialog|alert|popup)(?:\s+with\s+text\s+[\"']?([^\"']+)[\"']?)?", command)
+        return {
+            "action": "wait",
+            "seconds": int(wait_match.group("seconds"))
+        }
+    
+    def _parse_dialog(self, command: str) -> Optional[Dict[str, Any]]:
+        """Parse dialog handling commands."""
+        dialog_match = DIALOG_RE.match(command)
         if dialog_match:
-            action = dialog_match.group(1).lower()
-            text = dialog_match.group(3).strip() if dialog_match.group(3) else ""
-            
-            dialog_action = "accept" if action == "accept" else "dismiss"
-            
-            result = {
+            return {
                 "action": "handle_dialog",
-                "dialog_action": dialog_action,
-                "prompt_text": text
+                "dialog_action": DIALOG_ACTIONS[dialog_match.group(1)],
+                "prompt_text": dialog_match.group(3) or ""
             }
-            self.add_to_memory(result)
-            return result
-            
-        # Exit command
-        if command in ["exit", "quit", "close"]:
-            return {"action": "exit"}
+        return None
+    
+    # First word of a command -> parser that only tries the patterns starting with it
+    COMMAND_PARSERS = {
+        "go": _parse_go,
+        "on": _parse_on,
+        "search": _parse_search,
+        "find": _parse_search,
+        "open": _parse_open,
+        "click": _parse_click,
+        "select": _parse_select,
+        "type": _parse_type,
+        "submit": _parse_submit,
+        "scroll": _parse_scroll,
+        "run": _parse_run_js,
+        "execute": _parse_run_js,
+        "wait": _parse_wait,
+        "accept": _parse_dialog,
+        "dismiss": _parse_dialog,
+        "handle": _parse_dialog,
+    }
+    
+    async def process_command(self, command):
+        """Process a natural language command."""
+        if not command:
+            return False
             
-        # Help command
-        if command in ["help", "commands", "usage"]:
-            return {"action": "help"}
+        # Normalize once, the patterns are all lowercase and compiled without IGNORECASE
+        command = command.lower().strip()
+        
+        # Fixed commands are a plain lookup
+        result = SIMPLE_COMMAND_RESULTS.get(command)
+        if result:
+            if result["action"] not in UNRECORDED_ACTIONS:
+                self.add_to_memory(result)
+            return result
+        
+        # Only run the patterns for the command's first word
+        first_word = command.split(maxsplit=1)[0] if command else ""
+        parser = self.COMMAND_PARSERS.get(first_word)
+        result = parser(self, command) if parser else None
+        
+        if not result:
+            # Could not interpret command
+            return False
             
-        # Could not interpret command
-        return False
+        self.add_to_memory(result)
+        return result
 
 
 class TaskAgent(BrowserAgent):
@@ -892,6 +1098,9 @@ class TaskAgent(BrowserAgent):
         self.plan = []
         self.current_step = 0
         self.max_steps = 30
+        self.step_delay = 0  # Extra seconds to pause between steps, for callers that want pacing
+        self.prefetch_steps = True  # Refine the next step while the current one runs; False for strict ordering
+        self._page_info_cache = {"url": None, "title": None}
         
     def set_task(self, task):
         """Set a new task for the agent."""
@@ -913,25 +1122,79 @@ class TaskAgent(BrowserAgent):
         if not self.plan or self.current_step >= len(self.plan):
             return None
             
-        # Get the current step
-        step = self.plan[self.current_step]
-        
-        # Refine the step based on current page state if we have a page
-        if self.page:
-            try:
-                page_info = {
-                    "url": self.page.url,
-                    "title": await self.page.title()
-                }
-                step = await self.refine_plan_step(step, page_info)
-            except:
-                pass
-                
-        # Increment step counter
+        # Refine the current step, then move past it
+        step = await self._refine_step(self.current_step)
         self.current_step += 1
         
         return step
         
+    async def _refine_step(self, index):
+        """Refine the plan step at index against the current page state, if we have a live page."""
+        step = self.plan[index]
+        if self.page and not self.page.is_closed():
+            page_info = await self._current_page_info()
+            if page_info is not None:
+                step = await self.refine_plan_step(step, page_info)
+        return step
+        
+    async def _current_page_info(self) -> Optional[Dict[str, Any]]:
+        """Collect the url, title and DOM structure used to refine a step, or None if the page went away."""
+        # Only ask the browser for the title when the page has moved
+        cur_url = self.page.url
+        if cur_url == self._page_info_cache["url"]:
+            dom_structure = await self.extract_dom_structure()
+        else:
+            try:
+                title, dom_structure = await asyncio.gather(
+                    self.page.title(),
+                    self.extract_dom_structure()
+                )
+            except PlaywrightError as e:
+                logger.warning(f"Could not read page state for refinement: {str(e)}")
+                return None
+            self._page_info_cache = {"url": cur_url, "title": title}
+            
+        return {
+            **self._page_info_cache,
+            "dom_structure": dom_structure
+        }
+        
+    async def _steps(self, first_step, step_count):
+        """Yield step_count refined steps from first_step on, settling the page after each one is executed."""
+        last_step = first_step + step_count
+        next_step = None
+        try:
+            for index in range(first_step, last_step):
+                # Use the step refined while the previous one ran, if any
+                step = await (next_step or self._refine_step(index))
+                next_step = None
+                self.current_step = index + 1
+                
+                # Skip if no step
+                if not step:
+                    continue
+                    
+                # Refine the following step while the consumer executes this one
+                if self.prefetch_steps and index + 1 < last_step:
+                    next_step = asyncio.create_task(self._refine_step(index + 1))
+                    
+                yield step
+                
+                # Resumed once the consumer has executed the step
+                if self.page:
+                    # Let a navigation started by the step settle; returns at once on an idle page
+                    try:
+                        await self.page.wait_for_load_state("domcontentloaded", timeout=1000)
+                    except Exception:
+                        pass
+                        
+                if self.step_delay:
+                    await asyncio.sleep(self.step_delay)
+        finally:
+            # Drop a refinement the consumer stopped before using
+            if next_step:
+                next_step.cancel()
+        
     async def execute_plan(self, callback=None):
         """
         Execute the current plan.
@@ -946,27 +1209,21 @@ class TaskAgent(BrowserAgent):
             logger.error("No plan to execute")
             return False
             
-        step_count = 0
+        # Fix the steps to run up front, current_step then just follows the index
+        first_step = self.current_step
+        step_count = max(min(len(self.plan) - first_step, self.max_steps), 0)
         
-        # Execute each step in the plan
-        while self.current_step < len(self.plan) and step_count < self.max_steps:
-            step = await self.get_next_step()
-            step_count += 1
-            
-            # Skip if no step
-            if not step:
-                continue
+        # Execute each step in the plan, closing the generator at once if the callback stops early
+        async with aclosing(self._steps(first_step, step_count)) as steps:
+            async for step in steps:
+                # Log the step
+                logger.info("Executing step %d/%d: %s", self.current_step, len(self.plan), step)
                 
-            # Log the step
-            logger.info(f"Executing step {self.current_step}/{len(self.plan)}: {step}")
-            
-            # Call the callback if provided
-            if callback:
-                if not await callback(step):
-                    logger.info("Execution stopped by callback")
-                    return False
-                    
-            await asyncio.sleep(1)  # Brief pause between steps
-            
-        logger.info(f"Plan executed with {step_count} steps")
+                # Call the callback if provided
+                if callback:
+                    if not await callback(step):
+                        logger.info("Execution stopped by callback")
+                        return False
+                        
+        logger.info("Plan executed with %d steps", step_count)
         return True 
\ No newline at end of file
@@ -1,6 +1,11 @@
 """
 Browser action handlers for AI Browser Assistant.
 Contains functions for interacting with web pages through Playwright.
+
+Every action works on the Page it is given and never opens browsers, contexts or pages of
+its own. Callers keep one Browser and reuse its context and page across actions (as cli.py
+does). To run actions concurrently, give each task its own page or context from the same
+Browser and await them together on one event loop.
 """
 
 import time
@@ -8,10 +13,16 @@ import os
 import re
 import logging
 import asyncio
+import hashlib
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Tuple, Union
+from urllib.parse import quote_plus, urlparse
 
-from playwright.async_api import Page, ElementHandle
+from playwright.async_api import Page, ElementHandle, TimeoutError as PlaywrightTimeoutError
 
 from config import (
     get_site_name, 
@@ -24,46 +35,507 @@ from config import (
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def take_screenshot(page: Page, filename: Optional[str] = None) -> str:
+# "all" saves a screenshot after every action, "final" leaves screenshots to explicit requests
+SCREENSHOT_MODE = os.environ.get("SCREENSHOT_MODE", "all").lower()
+
+# Set while a chain of actions runs, so only the chain's final screenshot is taken
+_action_screenshots_suppressed = ContextVar("action_screenshots_suppressed", default=False)
+
+# Screenshot files still being written in worker threads
+_pending_writes = set()
+
+# Threads that write screenshots, kept apart from the default executor so a burst of
+# screenshots doesn't hold up other to_thread work
+_screenshot_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot")
+
+# Where action screenshots are saved, created with the first one
+SCREENSHOT_DIR = "screenshots"
+_screenshot_dir_ready = False
+
+# Action screenshots are debug traces, a viewport JPEG is enough for them
+SCREENSHOT_JPEG_QUALITY = 60
+
+# Dedup key, content digest and path of the last screenshot, so an unchanged page isn't
+# captured or written again
+_last_screenshot = (None, None, "")
+
+# Finds the element best matching a smart_click description, highlights it and returns its position
+SMART_CLICK_ANALYSIS_JS = """(targetDescription) => {
+    const isFirstItem = targetDescription.toLowerCase().includes('first') || 
+                        targetDescription.toLowerCase().includes('1st');
+    const isProduct = targetDescription.toLowerCase().includes('product') || 
+                    targetDescription.toLowerCase().includes('item') || 
+                    targetDescription.toLowerCase().includes('result');
+    const targetWords = targetDescription.toLowerCase().split(/\\s+/);
+    const PRICE_RE = /[$€£¥]\\s?\\d+([.,]\\d+)?/;
+    const MAX_CANDIDATES = 200;
+    
+    // Helper function to get text content
+    const getVisibleText = (element) => {
+        return element.innerText || element.textContent || '';
+    };
+    
+    // Helper function to get an element's rect if it is visible, or null
+    const visibleRect = (element) => {
+        if (!element) return null;
+        
+        const style = window.getComputedStyle(element);
+        if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') {
+            return null;
+        }
+        
+        const rect = element.getBoundingClientRect();
+        const visible = rect.width > 0 && rect.height > 0 && 
+               rect.top >= 0 && rect.top < window.innerHeight &&
+               rect.left >= 0 && rect.left < window.innerWidth;
+        return visible ? rect : null;
+    };
+    
+    // Get all clickable elements
+    const getAllClickableElements = () => {
+        const clickableElements = [];
+        
+        // Get all potentially clickable elements
+        const elements = document.querySelectorAll('a, button, [role="button"], [onclick], [role="link"], input[type="submit"], input[type="button"], .clickable');
+        
+        // Read geometry for every candidate first, then text, so layout is
+        // computed once rather than interleaved with innerText reads.
+        // Stop once enough visible candidates have been found.
+        const visible = [];
+        for (const element of elements) {
+            const rect = visibleRect(element);
+            if (rect) visible.push([element, rect]);
+            if (visible.length >= MAX_CANDIDATES) break;
+        }
+        
+        visible.forEach(([element, rect]) => {
+            const text = getVisibleText(element).trim();
+            const hasImage = element.querySelector('img') !== null;
+            const hasPrice = PRICE_RE.test(text);
+            
+            // Score the element based on various factors
+            let score = 0;
+            
+            // Size-based score (bigger is likely more important)
+            score += (rect.width * rect.height) / 10000;
+            
+            // Elements with images are likely products
+            if (hasImage) score += 20;
+            
+            // Elements with prices are likely products
+            if (hasPrice) score += 30;
+            
+            // Elements with meaningful text are more important
+            if (text.length > 0) score += Math.min(text.length, 50) / 5;
+            
+            // Specific element type bonuses
+            if (element.tagName === 'BUTTON') score += 10;
+            if (element.tagName === 'A') score += 5;
+            if (element.getAttribute('role') === 'button') score += 10;
+            
+            // Create a detailed representation of the element
+            clickableElements.push({
+                element: element,
+                tag: element.tagName.toLowerCase(),
+                text: text,
+                x: rect.left,
+                y: rect.top,
+                width: rect.width,
+                height: rect.height,
+                hasImage: hasImage,
+                hasPrice: hasPrice,
+                area: rect.width * rect.height,
+                score: score
+            });
+        });
+        
+        return clickableElements;
+    };
+    
+    // Find product-like elements
+    const findProductElements = () => {
+        const elements = getAllClickableElements();
+        
+        // Look for elements inside common product containers
+        const productContainers = document.querySelectorAll(
+            '.product, .item, .result, [class*="product"], [class*="item"], [class*="result"], [class*="card"]'
+        );
+        
+        const productsInContainers = [];
+        productContainers.forEach(container => {
+            if (!visibleRect(container)) return;
+            
+            // Find clickable elements within this container
+            const clickableChildren = [];
+            elements.forEach(el => {
+                if (container.contains(el.element)) {
+                    // Boost score for elements in product containers
+                    el.score += 15;
+                    clickableChildren.push(el);
+                }
+            });
+            
+            // Get the highest scored element in this container
+            if (clickableChildren.length > 0) {
+                clickableChildren.sort((a, b) => b.score - a.score);
+                productsInContainers.push(clickableChildren[0]);
+            }
+        });
+        
+        // Sort all elements by score
+        elements.sort((a, b) => b.score - a.score);
+        
+        // Return both collections
+        return {
+            allElements: elements,
+            productsInContainers: productsInContainers
+        };
+    };
+    
+    const products = findProductElements();
+    
+    // Get element to click based on description
+    let elementToClick = null;
+    
+    if (isProduct) {
+        // Use products in containers if available
+        if (products.productsInContainers.length > 0) {
+            elementToClick = isFirstItem ? 
+                products.productsInContainers[0].element : 
+                products.productsInContainers[Math.floor(Math.random() * products.productsInContainers.length)].element;
+        } 
+        // Otherwise use the best-scored elements
+        else if (products.allElements.length > 0) {
+            elementToClick = isFirstItem ? 
+                products.allElements[0].element : 
+                products.allElements[Math.floor(Math.random() * Math.min(5, products.allElements.length))].element;
+        }
+    } else {
+        // For non-product elements, just get the top matching element
+        let best = null;
+        for (const el of getAllClickableElements()) {
+            const text = el.text.toLowerCase();
+            // Match elements that contain words from the target description
+            if (!targetWords.some(word => text.includes(word))) continue;
+            if (!best || el.score > best.score) best = el;
+        }
+        
+        if (best) {
+            elementToClick = best.element;
+        }
+    }
+    
+    // Fallback to highest-scored element
+    if (!elementToClick && products.allElements.length > 0) {
+        elementToClick = products.allElements[0].element;
+    }
+    
+    if (elementToClick) {
+        // Keep the element so SMART_CLICK_TARGET_JS can click it directly
+        window.__smartClickTarget = elementToClick;
+        
+        // Get the element details for logging
+        const rect = elementToClick.getBoundingClientRect();
+        const details = {
+            tag: elementToClick.tagName,
+            text: getVisibleText(elementToClick).substring(0, 50),
+            hasImage: elementToClick.querySelector('img') !== null,
+            x: rect.left,
+            y: rect.top,
+            width: rect.width,
+            height: rect.height
+        };
+        
+        try {
+            // Highlight element temporarily for visual feedback
+            const originalStyle = elementToClick.getAttribute('style') || '';
+            elementToClick.setAttribute('style', 
+                originalStyle + '; outline: 3px solid red !important; transition: outline 0.3s;');
+            
+            // Scroll element into view
+            elementToClick.scrollIntoView({ behavior: 'smooth', block: 'center' });
+            
+            // Return only the details since we can't return the actual element
+            return details;
+        } catch (e) {
+            console.error('Error highlighting element:', e);
+            return details;
+        }
+    }
+    
+    return null;
+}"""
+
+# Clicks the element chosen by the last smart_click analysis, if it is still on the page
+SMART_CLICK_TARGET_JS = """() => {
+    const element = window.__smartClickTarget;
+    window.__smartClickTarget = null;
+    if (!element || !element.isConnected) return false;
+    element.click();
+    return true;
+}"""
+
+# Clicks the largest image on the page, or its clickable parent, measuring each image once
+IMAGE_FALLBACK_JS = """() => {
+    let img = null;
+    let rect = null;
+    let largestArea = 0;
+    for (const candidate of document.querySelectorAll('img')) {
+        if (!candidate.isConnected) continue;
+        const candidateRect = candidate.getBoundingClientRect();
+        const area = candidateRect.width * candidateRect.height;
+        if (candidateRect.width > 100 && candidateRect.height > 100 && area > 10000 && area > largestArea) {
+            img = candidate;
+            rect = candidateRect;
+            largestArea = area;
+        }
+    }
+    
+    if (img) {
+        // Try finding a clickable parent
+        let clickableParent = img;
+        while (clickableParent && clickableParent !== document.body) {
+            if (clickableParent.tagName === 'A' || 
+                clickableParent.onclick || 
+                clickableParent.getAttribute('role') === 'button') {
+                break;
+            }
+            clickableParent = clickableParent.parentElement;
+        }
+        
+        const elementToClick = clickableParent !== document.body ? clickableParent : img;
+        elementToClick.click();
+        
+        return {
+            success: true,
+            message: `Clicked ${elementToClick.tagName} containing image (${rect.width}x${rect.height})`
+        };
+    }
+    
+    return { success: false };
+}"""
+
+# Registers the analysis function on window, so each smart_click only ships a one-line call
+SMART_CLICK_INIT_JS = f"window.__smartClickAnalyze = {SMART_CLICK_ANALYSIS_JS};"
+
+# Browser contexts that run SMART_CLICK_INIT_JS in every new document
+_smart_click_contexts = weakref.WeakSet()
+
+# Index of the first probe that matches anything on the page, or -1. A probe is
+# ["css", selector], ["xpath", expression] or ["text", [css, lowercase text]].
+FIRST_MATCH_JS = """(probes) => {
+    // One walk over the DOM with all CSS probes joined tells whether any of them match,
+    // so a page without a match doesn't pay for a walk per selector
+    let anyCss = true;
+    try {
+        const css = probes.filter(([kind]) => kind === 'css').map(([, query]) => query);
+        anyCss = css.length > 0 && document.querySelector(css.join(', ')) !== null;
+    } catch (e) {
+        // One invalid selector spoils the joined list, check them one by one instead
+    }
+    
+    return probes.findIndex(([kind, query]) => {
+        try {
+            if (kind === 'xpath') {
+                return document.evaluate(query, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue !== null;
+            }
+            if (kind === 'text') {
+                const [css, text] = query;
+                return Array.from(document.querySelectorAll(css)).some(el => (el.textContent || '').toLowerCase().includes(text));
+            }
+            return anyCss && document.querySelector(query) !== null;
+        } catch (e) {
+            // Selectors that are not valid here simply don't match
+            return false;
+        }
+    });
+}"""
+
+# Playwright "tag:has-text('...')" selectors, probed in the page as a text search
+HAS_TEXT_RE = re.compile(r"^([\w.#-]+):has-text\('([^']*)'\)$")
+
+# Search inputs tried when the site specific and generic selectors found nothing
+COMMON_SEARCH_SELECTORS = (
+    "input[name='q']",
+    "input[type='search']",
+    "input[aria-label*='search' i]",
+    "input[placeholder*='search' i]",
+    ".search-box",
+    "#search-input",
+)
+
+# Selectors for an element with exactly the given text, filled in with str.format
+CLICK_EXACT_SELECTORS = (
+    'text="{0}"',
+    "text='{0}'",
+    "text={0}",
+    '*:has-text("{0}")',
+    '[title="{0}"]',
+    '[aria-label="{0}"]',
+    '[placeholder="{0}"]',
+    'button:has-text("{0}")',
+    'a:has-text("{0}")',
+    'input[value="{0}"]',
+)
+
+# Selectors for an element partially matching the given text
+CLICK_PARTIAL_SELECTORS = (
+    "text='{0}'",
+    "*:has-text('{0}')",
+    "[title*='{0}' i]",
+    "[aria-label*='{0}' i]",
+    "button:has-text('{0}')",
+    "a:has-text('{0}')",
+)
+
+# Form fields identified by placeholder, name, aria-label, id or label text
+FIELD_SELECTORS = (
+    'input[placeholder="{0}"]',
+    'input[name="{0}"]',
+    'input[aria-label="{0}"]',
+    'textarea[placeholder="{0}"]',
+    'textarea[name="{0}"]',
+    'textarea[aria-label="{0}"]',
+    'input[id="{0}"]',
+    'textarea[id="{0}"]',
+    "//label[contains(text(), '{0}')]//following::input[1]",
+    "//label[contains(text(), '{0}')]//following::textarea[1]",
+)
+
+# Login and sign in controls smart_click tries before analyzing the page
+LOGIN_SELECTORS = (
+    "button:has-text('Login')",
+    "button:has-text('Sign In')",
+    "a:has-text('Login')",
+    "a:has-text('Sign In')",
+    "[type='submit']:has-text('Login')",
+    "[type='submit']:has-text('Sign In')",
+)
+
+# Fallback search input that worked last, per page and host, so later searches skip the probe
+_search_selector_cache = weakref.WeakKeyDictionary()
+
+# Submit controls, most specific first
+SUBMIT_SELECTORS = (
+    "form button[type='submit']",
+    "form input[type='submit']",
+    "button[type='submit']",
+    "input[type='submit']",
+    "button:has-text('Submit')",
+    "button:has-text('Send')",
+    "button:has-text('Login')",
+    "button:has-text('Sign in')",
+    "button:has-text('Register')",
+    "button:has-text('Sign up')",
+    "button:has-text('Continue')",
+    ".submit-button",
+    "#submit",
+)
+
+async def take_screenshot(page: Page, filename: Optional[str] = None, defer: bool = True,
+                          dedup_key: Optional[str] = None) -> str:
     """
     Take a screenshot of the current page.
     
     Args:
         page: The Playwright page object
         filename: Optional custom filename
+        defer: Write the file in the background instead of waiting for it
+        dedup_key: Skip the capture if the last screenshot was taken with the same key
+        
+    Without a custom filename, a screenshot identical to the last one isn't written again.
         
     Returns:
         Path to the saved screenshot
     """
+    global _screenshot_dir_ready, _last_screenshot
     if not page:
         logger.error("No browser window open")
         return ""
         
+    # Nothing has changed since the last screenshot, so reuse it
+    if dedup_key is not None and dedup_key == _last_screenshot[0]:
+        return _last_screenshot[2]
+        
     try:
-        # Create screenshots directory if it doesn't exist
-        os.makedirs("screenshots", exist_ok=True)
+        # Create screenshots directory once, not on every screenshot
+        if not _screenshot_dir_ready:
+            os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+            _screenshot_dir_ready = True
+        
+        # Take the screenshot
+        screenshot_bytes = await page.screenshot(type="jpeg", quality=SCREENSHOT_JPEG_QUALITY, full_page=False)
+        digest = hashlib.blake2b(screenshot_bytes, digest_size=16).digest()
         
+        # The page looks exactly as it did last time, so point to the existing file
+        if not filename and digest == _last_screenshot[1]:
+            _last_screenshot = (dedup_key, digest, _last_screenshot[2])
+            return _last_screenshot[2]
+            
         # Generate filename if not provided
         if not filename:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screenshot_{timestamp}.png"
+            filename = f"screenshot_{timestamp}.jpg"
             
-        # Ensure filename has .png extension
-        if not filename.endswith('.png'):
-            filename += '.png'
+        # Ensure filename has .jpg extension
+        if not filename.endswith('.jpg'):
+            filename += '.jpg'
             
         # Full path to save the screenshot
-        path = os.path.join("screenshots", filename)
+        path = os.path.join(SCREENSHOT_DIR, filename)
         
-        # Take the screenshot
-        await page.screenshot(path=path)
-        logger.info(f"Screenshot saved to {path}")
+        # Write the file in a worker thread, waiting for it only if asked to
+        write = asyncio.get_running_loop().run_in_executor(_screenshot_pool, _save_screenshot, path, screenshot_bytes)
+        if not defer:
+            await write
+        else:
+            task = asyncio.ensure_future(write)
+            _pending_writes.add(task)
+            task.add_done_callback(_pending_writes.discard)
+            
+        _last_screenshot = (dedup_key, digest, path)
         return path
         
     except Exception as e:
         logger.error(f"Error taking screenshot: {str(e)}")
         return ""
 
+def _save_screenshot(path: str, screenshot_bytes: bytes) -> None:
+    """Write screenshot bytes to disk, run off the event loop."""
+    try:
+        with open(path, "wb") as f:
+            f.write(screenshot_bytes)
+        logger.info(f"Screenshot saved to {path}")
+    except Exception as e:
+        logger.error(f"Error saving screenshot: {str(e)}")
+
+async def wait_for_pending_screenshots() -> None:
+    """Wait for screenshots still being written to disk."""
+    if _pending_writes:
+        await asyncio.gather(*_pending_writes)
+
+@contextmanager
+def suppress_action_screenshots():
+    """Skip the screenshots that follow each action for the duration of the block."""
+    token = _action_screenshots_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _action_screenshots_suppressed.reset(token)
+
+async def screenshot_after_action(page: Page, dedup_key: Optional[str] = None) -> str:
+    """Take the screenshot that follows an action, unless SCREENSHOT_MODE is "final" or they are suppressed."""
+    if SCREENSHOT_MODE == "final" or _action_screenshots_suppressed.get():
+        return ""
+    return await take_screenshot(page, dedup_key=dedup_key)
+
+async def _wait_for_network_idle(page: Page, timeout: int) -> None:
+    """Wait for the page to go quiet on the network, giving up silently after timeout milliseconds."""
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+    except Exception:
+        pass
+
 async def navigate(page: Page, url: str) -> bool:
     """
     Navigate to a URL.
@@ -84,13 +556,13 @@ async def navigate(page: Page, url: str) -> bool:
         if not url.startswith(("http://", "https://")):
             url = "https://" + url
             
+        # goto returns once the page has loaded
         await page.goto(url)
-        await asyncio.sleep(1)  # Wait for page to load
         current_url = page.url
         logger.info(f"Navigated to {current_url}")
         
-        # Take a screenshot after navigation
-        await take_screenshot(page)
+        # Take a screenshot after navigation, unless it landed on the page already captured
+        await screenshot_after_action(page, dedup_key=current_url)
         return True
         
     except Exception as e:
@@ -116,8 +588,16 @@ async def search_on_current_site(page: Page, query: str) -> bool:
         current_url = page.url.lower()
         success = False
         
-        # Get site-specific search selector
-        search_selector = get_search_selector(current_url)
+        # A blank or browser-internal page has no search box to look for
+        if not current_url.startswith(("http://", "https://")):
+            logger.info(f"No site open to search on. Using Google search.")
+            await navigate(page, f"https://www.google.com/search?q={quote_plus(query)}")
+            return True
+        
+        # Get site-specific search selectors, by host so a site named in the path or query doesn't match
+        host = urlparse(current_url).hostname or current_url
+        search_selector, button_selector = get_search_selector(host), get_search_button_selector(host)
+        known_selectors = _search_selector_cache.setdefault(page, {})
         
         # Try site-specific search selector
         if isinstance(search_selector, str):
@@ -125,7 +605,6 @@ async def search_on_current_site(page: Page, query: str) -> bool:
                 await page.fill(search_selector, query)
                 
                 # Check if we need to click a search button or just press Enter
-                button_selector = get_search_button_selector(current_url)
                 if button_selector:
                     await page.click(button_selector)
                 else:
@@ -136,50 +615,45 @@ async def search_on_current_site(page: Page, query: str) -> bool:
             except Exception as e:
                 logger.debug(f"Failed with primary selector: {str(e)}")
         
-        # Try generic selectors if site-specific one failed
-        if not success and isinstance(search_selector, list):
-            for selector in search_selector:
-                try:
-                    if await page.query_selector(selector):
-                        await page.fill(selector, query)
-                        await page.press(selector, "Enter")
-                        success = True
-                        logger.info(f"Searched using {selector} for: {query}")
-                        break
-                except Exception as e:
-                    logger.debug(f"Failed with selector {selector}: {str(e)}")
+        # Try the fallback selector that worked on this host before
+        if not success and host in known_selectors:
+            selector = known_selectors[host]
+            try:
+                await page.fill(selector, query, timeout=1500)
+                await page.press(selector, "Enter")
+                success = True
+                logger.info(f"Searched using {selector} for: {query}")
+            except Exception as e:
+                logger.debug(f"Cached selector {selector} no longer works: {str(e)}")
+                del known_selectors[host]
         
         if not success:
-            # Try common search selectors
-            common_search_selectors = [
-                "input[name='q']",
-                "input[type='search']",
-                "input[aria-label*='search' i]",
-                "input[placeholder*='search' i]",
-                ".search-box",
-                "#search-input"
+            # Try generic selectors if site-specific one failed, then common ones not already among them
+            generic_selectors = search_selector if isinstance(search_selector, list) else []
+            fallback_selectors = generic_selectors + [
+                selector for selector in COMMON_SEARCH_SELECTORS if selector not in generic_selectors
             ]
             
-            for selector in common_search_selectors:
+            # Find the first search input in a single round trip
+            selector = await _first_matching_selector(page, fallback_selectors)
+            if selector:
                 try:
-                    search_input = await page.query_selector(selector)
-                    if search_input:
-                        await page.fill(selector, query)
-                        await page.press(selector, "Enter")
-                        success = True
-                        logger.info(f"Searched using common selector {selector} for: {query}")
-                        break
+                    await page.fill(selector, query)
+                    await page.press(selector, "Enter")
+                    success = True
+                    known_selectors[host] = selector
+                    logger.info(f"Searched using {selector} for: {query}")
                 except Exception as e:
-                    continue
+                    logger.debug(f"Failed with selector {selector}: {str(e)}")
         
         if success:
             # Wait for results to load
-            await asyncio.sleep(2)
-            await take_screenshot(page)
+            await _wait_for_network_idle(page, 2000)
+            await screenshot_after_action(page)
             return True
         else:
             logger.warning(f"Could not find a way to search on this site. Falling back to Google search.")
-            await navigate(page, f"https://www.google.com/search?q={'+'.join(query.split())}")
+            await navigate(page, f"https://www.google.com/search?q={quote_plus(query)}")
             return True
             
     except Exception as e:
@@ -202,50 +676,37 @@ async def click_element_with_text(page: Page, text: str) -> bool:
         return False
         
     try:
-        # Try clicking element with exact text
-        selectors = [
-            f"text=\"{text}\"",
-            f"text='{text}'",
-            f"text={text}",
-            f"*:has-text(\"{text}\")",
-            f"[title=\"{text}\"]",
-            f"[aria-label=\"{text}\"]",
-            f"[placeholder=\"{text}\"]",
-            f"button:has-text(\"{text}\")",
-            f"a:has-text(\"{text}\")",
-            f"input[value=\"{text}\"]",
-        ]
-        
-        for selector in selectors:
-            try:
-                await page.click(selector, timeout=3000)
-                logger.info(f"Clicked element with text: {text}")
-                await asyncio.sleep(1)
-                await take_screenshot(page)
-                return True
-            except:
-                continue
-                
-        # If exact match failed, try partial match
-        logger.info(f"Exact match failed, trying partial match for: {text}")
-        selectors = [
-            f"text='{text}'",
-            f"*:has-text('{text}')",
-            f"[title*='{text}' i]",
-            f"[aria-label*='{text}' i]",
-            f"button:has-text('{text}')",
-            f"a:has-text('{text}')",
-        ]
-        
-        for selector in selectors:
-            try:
-                await page.click(selector, timeout=3000)
-                logger.info(f"Clicked element with partial text match: {text}")
-                await asyncio.sleep(1)
-                await take_screenshot(page)
-                return True
-            except:
-                continue
+        # Selectors for an exact and a partial text match
+        exact_selectors = [template.format(text) for template in CLICK_EXACT_SELECTORS]
+        partial_selectors = [template.format(text) for template in CLICK_PARTIAL_SELECTORS]
+        
+        # Wait once for any candidate to appear, rather than timing out on each selector in turn
+        any_candidate = page.locator(exact_selectors[0])
+        for selector in exact_selectors[1:] + partial_selectors:
+            any_candidate = any_candidate.or_(page.locator(selector))
+        try:
+            await any_candidate.first.wait_for(state="attached", timeout=3000)
+        except PlaywrightTimeoutError:
+            logger.warning(f"Could not find element with text: {text}")
+            return False
+        except Exception as e:
+            # A selector the text made invalid, probe the others one by one
+            logger.debug(f"Combined selector wait failed: {str(e)}")
+        
+        # Click the first selector that matches, exact matches first
+        for selectors, match_type in ((exact_selectors, "text"), (partial_selectors, "partial text match")):
+            for selector in selectors:
+                try:
+                    if await page.locator(selector).count():
+                        await page.click(selector, timeout=3000)
+                        logger.info(f"Clicked element with {match_type}: {text}")
+                        await screenshot_after_action(page)
+                        return True
+                except Exception:
+                    continue
+                    
+            if selectors is exact_selectors:
+                logger.info(f"Exact match failed, trying partial match for: {text}")
                 
         logger.warning(f"Could not find element with text: {text}")
         return False
@@ -272,8 +733,7 @@ async def click_element_with_selector(page: Page, selector: str) -> bool:
     try:
         await page.click(selector, timeout=5000)
         logger.info(f"Clicked element with selector: {selector}")
-        await asyncio.sleep(1)
-        await take_screenshot(page)
+        await screenshot_after_action(page)
         return True
     except Exception as e:
         logger.error(f"Error clicking element with selector {selector}: {str(e)}")
@@ -320,34 +780,15 @@ async def type_text_in_field(page: Page, text: str, field_identifier: str) -> bo
         return False
         
     try:
-        selectors = [
-            f"input[placeholder=\"{field_identifier}\"]",
-            f"input[name=\"{field_identifier}\"]",
-            f"input[aria-label=\"{field_identifier}\"]",
-            f"textarea[placeholder=\"{field_identifier}\"]",
-            f"textarea[name=\"{field_identifier}\"]",
-            f"textarea[aria-label=\"{field_identifier}\"]",
-            f"input[id=\"{field_identifier}\"]",
-            f"textarea[id=\"{field_identifier}\"]",
-            f"//label[contains(text(), '{field_identifier}')]//following::input[1]",
-            f"//label[contains(text(), '{field_identifier}')]//following::textarea[1]",
-        ]
-        
-        for selector in selectors:
-            try:
-                if selector.startswith("//"):
-                    # XPath selector
-                    element = page.locator(selector)
-                else:
-                    # CSS selector
-                    element = page.locator(selector)
-                    
-                if await element.count() > 0:
-                    await element.fill(text)
-                    logger.info(f"Typed '{text}' into field: {field_identifier}")
-                    return True
-            except:
-                continue
+        selectors = [template.format(field_identifier) for template in FIELD_SELECTORS]
+        
+        # Find the field in a single round trip, then fill it; the field already exists, so a
+        # short timeout only covers it becoming editable
+        selector = await _first_matching_selector(page, selectors)
+        if selector:
+            await page.locator(selector).first.fill(text, timeout=1500)
+            logger.info(f"Typed '{text}' into field: {field_identifier}")
+            return True
                 
         logger.warning(f"Could not find field: {field_identifier}")
         return False
@@ -371,32 +812,17 @@ async def submit_form(page: Page) -> bool:
         return False
         
     try:
-        selectors = [
-            "form button[type='submit']",
-            "form input[type='submit']",
-            "button[type='submit']",
-            "input[type='submit']",
-            "button:has-text('Submit')",
-            "button:has-text('Send')",
-            "button:has-text('Login')",
-            "button:has-text('Sign in')",
-            "button:has-text('Register')",
-            "button:has-text('Sign up')",
-            "button:has-text('Continue')",
-            ".submit-button",
-            "#submit",
-        ]
-        
-        for selector in selectors:
-            try:
-                if await page.query_selector(selector):
-                    await page.click(selector)
-                    logger.info(f"Submitted form using selector: {selector}")
-                    await asyncio.sleep(2)  # Wait for form submission
-                    await take_screenshot(page)
-                    return True
-            except:
-                continue
+        # Find a submit control in a single round trip
+        try:
+            selector = await _first_matching_selector(page, SUBMIT_SELECTORS)
+            if selector:
+                await page.click(selector)
+                logger.info(f"Submitted form using selector: {selector}")
+                await _wait_for_network_idle(page, 2000)  # Wait for form submission
+                await screenshot_after_action(page)
+                return True
+        except Exception as e:
+            logger.debug(f"Failed to click submit control: {str(e)}")
                 
         # If no submit button found, try pressing Enter on the last input
         try:
@@ -405,8 +831,8 @@ async def submit_form(page: Page) -> bool:
                 last_input = inputs[-1]
                 await last_input.press("Enter")
                 logger.info("Submitted form by pressing Enter on last input")
-                await asyncio.sleep(2)
-                await take_screenshot(page)
+                await _wait_for_network_idle(page, 2000)
+                await screenshot_after_action(page)
                 return True
         except:
             pass
@@ -445,8 +871,9 @@ async def scroll_page(page: Page, direction: str, amount: Optional[int] = None)
         await page.evaluate(f"window.scrollBy(0, {scroll_amount})")
         
         logger.info(f"Scrolled {direction} by {abs(scroll_amount)} pixels")
-        await asyncio.sleep(0.5)
-        await take_screenshot(page)
+        # Give content loaded on scroll a moment to arrive
+        await _wait_for_network_idle(page, 500)
+        await screenshot_after_action(page)
         return True
         
     except Exception as e:
@@ -469,62 +896,51 @@ async def find_text_on_page(page: Page, text: str) -> bool:
         return False
         
     try:
-        # Use the browser's built-in find functionality
-        await page.evaluate(f"window.find('{text}', false, false, true)")
-        
-        # Try to highlight the text with JavaScript
+        # Find with the browser's built-in find functionality and highlight the text in one evaluate
         highlight_script = """
         (text) => {
-            const findInPage = (element, searchText) => {
-                if (!element) return;
+            window.find(text, false, false, true);
+            
+            // Walk the text nodes iteratively, lowercasing the search text only once
+            const searchText = text.toLowerCase();
+            const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+            
+            let node;
+            while ((node = walker.nextNode())) {
+                if (!node.nodeValue.toLowerCase().includes(searchText)) continue;
                 
-                if (element.nodeType === Node.TEXT_NODE) {
-                    const content = element.textContent;
-                    if (content.toLowerCase().includes(searchText.toLowerCase())) {
-                        const range = document.createRange();
-                        range.selectNode(element);
-                        
-                        const selection = window.getSelection();
-                        selection.removeAllRanges();
-                        selection.addRange(range);
-                        
-                        // Scroll to the element
-                        try {
-                            element.parentNode.scrollIntoView({
-                                behavior: 'smooth',
-                                block: 'center'
-                            });
-                        } catch (e) {
-                            // Fallback if scrollIntoView is not available
-                            try {
-                                element.parentNode.scrollIntoView();
-                            } catch (e2) {
-                                console.error('Could not scroll to element');
-                            }
-                        }
-                        
-                        return true;
-                    }
-                } else {
-                    for (let i = 0; i < element.childNodes.length; i++) {
-                        if (findInPage(element.childNodes[i], searchText)) {
-                            return true;
-                        }
+                const range = document.createRange();
+                range.selectNode(node);
+                
+                const selection = window.getSelection();
+                selection.removeAllRanges();
+                selection.addRange(range);
+                
+                // Scroll to the element, instantly so nothing has to wait for an animation
+                try {
+                    node.parentNode.scrollIntoView({
+                        block: 'center'
+                    });
+                } catch (e) {
+                    // Fallback if scrollIntoView is not available
+                    try {
+                        node.parentNode.scrollIntoView();
+                    } catch (e2) {
+                        console.error('Could not scroll to element');
                     }
                 }
                 
-                return false;
-            };
+                return true;
+            }
             
-            return findInPage(document.body, text);
+            return false;
         }
         """
         found = await page.evaluate(highlight_script, text)
         
         if found:
             logger.info(f"Found and highlighted text: {text}")
-            await asyncio.sleep(1)
-            await take_screenshot(page)
+            await screenshot_after_action(page)
             return True
         else:
             logger.warning(f"Text not found: {text}")
@@ -558,6 +974,39 @@ async def execute_javascript(page: Page, code: str) -> Any:
         logger.error(f"Error executing JavaScript: {str(e)}")
         return None
 
+async def _first_matching_selector(page: Page, selectors) -> Optional[str]:
+    """Return the first of the Playwright selectors that matches the page, checking them all in one evaluate."""
+    probes = []
+    for selector in selectors:
+        has_text_match = HAS_TEXT_RE.match(selector)
+        if selector.startswith("//"):
+            probes.append(["xpath", selector])
+        elif has_text_match:
+            probes.append(["text", [has_text_match.group(1), has_text_match.group(2).lower()]])
+        else:
+            probes.append(["css", selector])
+            
+    index = await page.evaluate(FIRST_MATCH_JS, probes)
+    return selectors[index] if index >= 0 else None
+
+async def _analyze_for_smart_click(page: Page, target_description: str) -> Optional[Dict[str, Any]]:
+    """Run the smart_click analysis in the page, installing it the first time it is needed."""
+    if page.context not in _smart_click_contexts:
+        await page.context.add_init_script(SMART_CLICK_INIT_JS)
+        _smart_click_contexts.add(page.context)
+        
+    # Documents loaded before the init script was added don't have the function yet
+    element_details = await page.evaluate(
+        "(d) => window.__smartClickAnalyze ? window.__smartClickAnalyze(d) : false",
+        target_description
+    )
+    if element_details is False:
+        # Wrapped in a function body, evaluating the assignment itself would return the
+        # analysis function and Playwright would call it with no argument
+        await page.evaluate(f"() => {{ {SMART_CLICK_INIT_JS} }}")
+        element_details = await page.evaluate("(d) => window.__smartClickAnalyze(d)", target_description)
+    return element_details
+
 async def smart_click(page: Page, target_description: str) -> bool:
     """
     Intelligently click on an element based on a description.
@@ -577,312 +1026,46 @@ async def smart_click(page: Page, target_description: str) -> bool:
     try:
         # First, try standard selectors if this is a common element
         if any(term in target_description.lower() for term in ["login", "sign in", "signin"]):
-            common_selectors = [
-                "button:has-text('Login')", 
-                "button:has-text('Sign In')",
-                "a:has-text('Login')",
-                "a:has-text('Sign In')",
-                "[type='submit']:has-text('Login')",
-                "[type='submit']:has-text('Sign In')"
-            ]
-            for selector in common_selectors:
-                try:
-                    element = await page.query_selector(selector)
-                    if element:
-                        await element.click()
-                        logger.info(f"Clicked login/sign in element with selector: {selector}")
-                        return True
-                except Exception as e:
-                    continue
+            # Click whichever one is present, the click itself waits for it
+            login_element = page.locator(LOGIN_SELECTORS[0])
+            for selector in LOGIN_SELECTORS[1:]:
+                login_element = login_element.or_(page.locator(selector))
+            try:
+                await login_element.first.click(timeout=800)
+                logger.info("Clicked login/sign in element")
+                return True
+            except PlaywrightTimeoutError:
+                pass
+            except Exception as e:
+                logger.debug(f"Failed to click login/sign in element: {str(e)}")
         
         # Parse the target description
         is_first_item = any(term in target_description.lower() for term in ["first", "1st"])
         is_product = any(term in target_description.lower() for term in ["product", "item", "result"])
         
-        # JavaScript function to analyze the page and find clickable elements
-        analysis_script = """(targetDescription) => {
-            const isFirstItem = targetDescription.toLowerCase().includes('first') || 
-                                targetDescription.toLowerCase().includes('1st');
-            const isProduct = targetDescription.toLowerCase().includes('product') || 
-                            targetDescription.toLowerCase().includes('item') || 
-                            targetDescription.toLowerCase().includes('result');
-            
-            // Helper function to get text content
-            const getVisibleText = (element) => {
-                return element.innerText || element.textContent || '';
-            };
-            
-            // Helper function to check if an element is visible
-            const isVisible = (element) => {
-                if (!element) return false;
-                
-                const style = window.getComputedStyle(element);
-                if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') {
-                    return false;
-                }
-                
-                const rect = element.getBoundingClientRect();
-                return rect.width > 0 && rect.height > 0 && 
-                       rect.top >= 0 && rect.top < window.innerHeight &&
-                       rect.left >= 0 && rect.left < window.innerWidth;
-            };
-            
-            // Get all clickable elements
-            const getAllClickableElements = () => {
-                const clickableElements = [];
-                
-                // Get all potentially clickable elements
-                const elements = document.querySelectorAll('a, button, [role="button"], [onclick], [role="link"], input[type="submit"], input[type="button"], .clickable');
-                
-                elements.forEach(element => {
-                    if (!isVisible(element)) return;
-                    
-                    const rect = element.getBoundingClientRect();
-                    const text = getVisibleText(element).trim();
-                    const hasImage = element.querySelector('img') !== null;
-                    const hasPrice = /[$€£¥]\\s?[0-9]+([.,][0-9]+)?/.test(text);
-                    
-                    // Score the element based on various factors
-                    let score = 0;
-                    
-                    // Size-based score (bigger is likely more important)
-                    score += (rect.width * rect.height) / 10000;
-                    
-                    // Elements with images are likely products
-                    if (hasImage) score += 20;
-                    
-                    // Elements with prices are likely products
-                    if (hasPrice) score += 30;
-                    
-                    // Elements with meaningful text are more important
-                    if (text.length > 0) score += Math.min(text.length, 50) / 5;
-                    
-                    // Specific element type bonuses
-                    if (element.tagName === 'BUTTON') score += 10;
-                    if (element.tagName === 'A') score += 5;
-                    if (element.getAttribute('role') === 'button') score += 10;
-                    
-                    // Create a detailed representation of the element
-                    clickableElements.push({
-                        element: element,
-                        tag: element.tagName.toLowerCase(),
-                        text: text,
-                        x: rect.left,
-                        y: rect.top,
-                        width: rect.width,
-                        height: rect.height,
-                        hasImage: hasImage,
-                        hasPrice: hasPrice,
-                        area: rect.width * rect.height,
-                        score: score
-                    });
-                });
-                
-                return clickableElements;
-            };
-            
-            // Find product-like elements
-            const findProductElements = () => {
-                const elements = getAllClickableElements();
-                
-                // Look for elements inside common product containers
-                const productContainers = document.querySelectorAll(
-                    '.product, .item, .result, [class*="product"], [class*="item"], [class*="result"], [class*="card"]'
-                );
-                
-                const productsInContainers = [];
-                productContainers.forEach(container => {
-                    if (!isVisible(container)) return;
-                    
-                    // Find clickable elements within this container
-                    const clickableChildren = [];
-                    elements.forEach(el => {
-                        if (container.contains(el.element)) {
-                            // Boost score for elements in product containers
-                            el.score += 15;
-                            clickableChildren.push(el);
-                        }
-                    });
-                    
-                    // Get the highest scored element in this container
-                    if (clickableChildren.length > 0) {
-                        clickableChildren.sort((a, b) => b.score - a.score);
-                        productsInContainers.push(clickableChildren[0]);
-                    }
-                });
-                
-                // Sort all elements by score
-                elements.sort((a, b) => b.score - a.score);
-                
-                // Return both collections
-                return {
-                    allElements: elements,
-                    productsInContainers: productsInContainers
-                };
-            };
-            
-            const products = findProductElements();
-            
-            // Get element to click based on description
-            let elementToClick = null;
-            
-            if (isProduct) {
-                // Use products in containers if available
-                if (products.productsInContainers.length > 0) {
-                    elementToClick = isFirstItem ? 
-                        products.productsInContainers[0].element : 
-                        products.productsInContainers[Math.floor(Math.random() * products.productsInContainers.length)].element;
-                } 
-                // Otherwise use the best-scored elements
-                else if (products.allElements.length > 0) {
-                    elementToClick = isFirstItem ? 
-                        products.allElements[0].element : 
-                        products.allElements[Math.floor(Math.random() * Math.min(5, products.allElements.length))].element;
-                }
-            } else {
-                // For non-product elements, just get top matching elements
-                const elements = getAllClickableElements()
-                    .filter(el => {
-                        const text = el.text.toLowerCase();
-                        // Match elements that contain words from the target description
-                        const targetWords = targetDescription.toLowerCase().split(/\\s+/);
-                        return targetWords.some(word => text.includes(word));
-                    })
-                    .sort((a, b) => b.score - a.score);
-                
-                if (elements.length > 0) {
-                    elementToClick = elements[0].element;
-                }
-            }
-            
-            // Fallback to highest-scored element
-            if (!elementToClick && products.allElements.length > 0) {
-                elementToClick = products.allElements[0].element;
-            }
-            
-            if (elementToClick) {
-                // Get the element details for logging
-                const rect = elementToClick.getBoundingClientRect();
-                const details = {
-                    tag: elementToClick.tagName,
-                    text: getVisibleText(elementToClick).substring(0, 50),
-                    hasImage: elementToClick.querySelector('img') !== null,
-                    x: rect.left,
-                    y: rect.top,
-                    width: rect.width,
-                    height: rect.height
-                };
-                
-                try {
-                    // Highlight element temporarily for visual feedback
-                    const originalStyle = elementToClick.getAttribute('style') || '';
-                    elementToClick.setAttribute('style', 
-                        originalStyle + '; outline: 3px solid red !important; transition: outline 0.3s;');
-                    
-                    // Scroll element into view
-                    elementToClick.scrollIntoView({ behavior: 'smooth', block: 'center' });
-                    
-                    // Return only the details since we can't return the actual element
-                    return details;
-                } catch (e) {
-                    console.error('Error highlighting element:', e);
-                    return details;
-                }
-            }
-            
-            return null;
-        }"""
-        
         # Run the analysis script to find the best element
-        element_details = await page.evaluate(analysis_script, target_description)
+        element_details = await _analyze_for_smart_click(page, target_description)
         
         if element_details:
             # Log the details of the element we found
             logger.info(f"Found element to click: {element_details['tag']} with text: {element_details['text']}")
             
-            # Wait briefly for the visual highlight and scrolling
-            await asyncio.sleep(0.5)
-            
-            # Click where the element is
-            try:
-                await page.mouse.click(
-                    element_details['x'] + element_details['width'] / 2,
-                    element_details['y'] + element_details['height'] / 2
-                )
-                logger.info(f"Clicked at position ({element_details['x'] + element_details['width'] / 2}, {element_details['y'] + element_details['height'] / 2})")
-                await asyncio.sleep(1)
-                await take_screenshot(page)
+            # Click the element itself, so scrolling or reflow since the analysis can't make the click miss
+            if await page.evaluate(SMART_CLICK_TARGET_JS):
+                logger.info("Clicked element using JavaScript")
+                await _wait_for_network_idle(page, 1000)
+                await screenshot_after_action(page)
                 return True
-            except Exception as e:
-                logger.warning(f"Failed to click using mouse: {str(e)}")
-                
-                # Try clicking using JavaScript as a fallback
-                result = await page.evaluate("""(details) => {
-                    const elements = document.elementsFromPoint(
-                        details.x + details.width / 2, 
-                        details.y + details.height / 2
-                    );
-                    
-                    if (elements.length > 0) {
-                        elements[0].click();
-                        return true;
-                    }
-                    return false;
-                }""", element_details)
-                
-                if result:
-                    logger.info("Clicked element using JavaScript")
-                    await asyncio.sleep(1)
-                    await take_screenshot(page)
-                    return True
         
         # If all else fails, look for large images and try clicking those
         logger.warning("Could not find specific element to click, trying image fallback")
         try:
-            image_result = await page.evaluate("""() => {
-                const images = Array.from(document.querySelectorAll('img'))
-                    .filter(img => {
-                        if (!img.isConnected) return false;
-                        const rect = img.getBoundingClientRect();
-                        return rect.width > 100 && rect.height > 100 && rect.width * rect.height > 10000;
-                    })
-                    .sort((a, b) => {
-                        const aRect = a.getBoundingClientRect();
-                        const bRect = b.getBoundingClientRect();
-                        return (bRect.width * bRect.height) - (aRect.width * aRect.height);
-                    });
-                
-                if (images.length > 0) {
-                    const img = images[0];
-                    const rect = img.getBoundingClientRect();
-                    
-                    // Try finding a clickable parent
-                    let clickableParent = img;
-                    while (clickableParent && clickableParent !== document.body) {
-                        if (clickableParent.tagName === 'A' || 
-                            clickableParent.onclick || 
-                            clickableParent.getAttribute('role') === 'button') {
-                            break;
-                        }
-                        clickableParent = clickableParent.parentElement;
-                    }
-                    
-                    const elementToClick = clickableParent !== document.body ? clickableParent : img;
-                    elementToClick.click();
-                    
-                    return {
-                        success: true,
-                        message: `Clicked ${elementToClick.tagName} containing image (${rect.width}x${rect.height})`
-                    };
-                }
-                
-                return { success: false };
-            }""")
+            image_result = await page.evaluate(IMAGE_FALLBACK_JS)
             
             if image_result.get('success'):
                 logger.info(image_result.get('message', 'Clicked large image'))
-                await asyncio.sleep(1)
-                await take_screenshot(page)
+                await _wait_for_network_idle(page, 1000)
+                await screenshot_after_action(page)
                 return True
         except Exception as e:
             logger.error(f"Error with image fallback: {str(e)}")
@@ -21,7 +21,8 @@ from browser_actions import (
     smart_click, select_first_item, click_element_with_text, 
     click_element_with_selector, type_text_in_field, submit_form,
     scroll_page, find_text_on_page, execute_javascript,
-    take_screenshot, navigate, search_on_current_site
+    take_screenshot, navigate, search_on_current_site, wait_for_pending_screenshots,
+    suppress_action_screenshots
 )
 from config import is_known_searchable_site
 
@@ -41,73 +42,34 @@ page = None
 agent = None
 task_agent = None
 
+# Plan steps that only read the page, so there is nothing to let settle after them
+READ_ONLY_ACTIONS = {"screenshot", "analyze", "extract_data"}
+
+# Set once cleanup has run, so resources are never closed twice
+cleaned_up = False
+
+async def shutdown():
+    """Close the page, context and browser concurrently, then stop Playwright."""
+    await asyncio.gather(
+        *(resource.close() for resource in (page, browser_context, browser) if resource),
+        return_exceptions=True
+    )
+    if playwright:
+        try:
+            await playwright.stop()
+        except:
+            pass
+
 def cleanup_resources():
     """Clean up browser resources when the application exits."""
-    global browser, playwright, browser_context, page
+    global cleaned_up
     
-    print("[*] Cleaning up resources...")
+    if cleaned_up:
+        return
+    cleaned_up = True
     
-    # Use asyncio to clean up async resources
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        async def cleanup():
-            if page:
-                try:
-                    await page.close()
-                except:
-                    pass
-                
-            if browser_context:
-                try:
-                    await browser_context.close()
-                except:
-                    pass
-                
-            if browser:
-                try:
-                    await browser.close()
-                except:
-                    pass
-                
-            if playwright:
-                try:
-                    await playwright.stop()
-                except:
-                    pass
-                
-        future = asyncio.ensure_future(cleanup())
-        loop.run_until_complete(future)
-    else:
-        # If loop is not running, create a new one for cleanup
-        async def cleanup():
-            if page:
-                try:
-                    await page.close()
-                except:
-                    pass
-                
-            if browser_context:
-                try:
-                    await browser_context.close()
-                except:
-                    pass
-                
-            if browser:
-                try:
-                    await browser.close()
-                except:
-                    pass
-                
-            if playwright:
-                try:
-                    await playwright.stop()
-                except:
-                    pass
-                
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(cleanup())
-        loop.close()
+    print("[*] Cleaning up resources...")
+    asyncio.run(shutdown())
 
 # Register cleanup handlers
 atexit.register(cleanup_resources)
@@ -137,11 +99,12 @@ async def launch_browser(url=None):
     try:
         # Check if we already have a browser instance
         if browser:
-            # If we have a browser but no page/context, create new ones
-            if not page or not browser_context:
+            # If we have a browser but no open page/context, create new ones
+            if not page or page.is_closed() or not browser_context:
                 try:
-                    # Create a new context and page in the existing browser
-                    browser_context = await browser.new_context(viewport={"width": 1280, "height": 800})
+                    # Reuse the existing context if there is one, only the page needs replacing
+                    if not browser_context:
+                        browser_context = await browser.new_context(viewport={"width": 1280, "height": 800})
                     page = await browser_context.new_page()
                     await page.goto(url)
                     agent.set_browser_objects(page, browser, browser_context)
@@ -155,6 +118,11 @@ async def launch_browser(url=None):
                     except:
                         pass
                     browser = None
+            else:
+                # The page is still open, load the URL in it rather than opening another context
+                await page.goto(url)
+                await agent.take_screenshot()
+                return True
         
         # Make sure Playwright is initialized
         if not await init_playwright():
@@ -185,16 +153,23 @@ async def launch_browser(url=None):
         print(f"[!] Error launching browser: {str(e)}")
         return False
 
+async def settle(page, timeout=1500):
+    """Wait for the page to go quiet on the network, for at most timeout milliseconds."""
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+    except Exception:
+        pass
+
 # Wrapper function for browser actions
-async def process_command_dict(command_dict):
-    """Process a command dictionary."""
+async def process_command_dict(command_dict, screenshots=True):
+    """Process a command dictionary, taking screenshots after page changes unless screenshots is False."""
     global page, agent, browser
     
     if not command_dict or not isinstance(command_dict, dict):
         return False
     
     # Ensure browser is launched when needed
-    if not page or not browser:
+    if not page or page.is_closed() or not browser:
         if command_dict.get("action") == "navigate":
             print("[*] Launching browser for navigation...")
             if not await launch_browser(command_dict.get("url")):
@@ -217,7 +192,7 @@ async def process_command_dict(command_dict):
         query = command_dict.get("query")
         
         if await navigate(page, url):
-            await asyncio.sleep(2)  # Wait for page to load
+            await settle(page)  # Wait for page to load
             return await search_on_current_site(page, query)
         return False
         
@@ -227,7 +202,8 @@ async def process_command_dict(command_dict):
     elif action == "back":
         if page:
             await page.go_back()
-            await agent.take_screenshot()
+            if screenshots:
+                await agent.take_screenshot()
             print(f"[*] Navigated back to: {page.url}")
             return True
         return False
@@ -235,7 +211,8 @@ async def process_command_dict(command_dict):
     elif action == "forward":
         if page:
             await page.go_forward()
-            await agent.take_screenshot()
+            if screenshots:
+                await agent.take_screenshot()
             print(f"[*] Navigated forward to: {page.url}")
             return True
         return False
@@ -243,7 +220,8 @@ async def process_command_dict(command_dict):
     elif action == "refresh":
         if page:
             await page.reload()
-            await agent.take_screenshot()
+            if screenshots:
+                await agent.take_screenshot()
             print(f"[*] Page refreshed: {page.url}")
             return True
         return False
@@ -318,8 +296,24 @@ async def process_command_dict(command_dict):
         print(f"[*] Dialog handler set to {dialog_action}")
         return True
         
+    elif action == "chain":
+        # Run the steps back to back, stopping at the first failure, with one screenshot at the end
+        result = True
+        with suppress_action_screenshots():
+            for step in command_dict.get("steps", []):
+                result = await process_command_dict(step, screenshots=False)
+                if not result:
+                    break
+                    
+        await settle(page)
+        if screenshots:
+            await agent.take_screenshot()
+        return result
+        
     elif action == "exit":
         print("[*] Exiting...")
+        await agent.wait_for_pending_writes()
+        await wait_for_pending_screenshots()
         sys.exit(0)
         
     elif action == "help":
@@ -469,8 +463,9 @@ async def execute_planned_task():
         # Execute the step using the appropriate function
         result = await process_command_dict(step)
         
-        # Brief pause between steps
-        await asyncio.sleep(1)
+        # Let the page settle between steps, unless the step left it as it was
+        if action not in READ_ONLY_ACTIONS:
+            await settle(page)
         
         return result
     
@@ -533,6 +528,8 @@ Type 'plan <task>' to create an autonomous plan
             await process_command(command)
     except (KeyboardInterrupt, EOFError):
         print("\n[*] Exiting...")
+        await agent.wait_for_pending_writes()
+        await wait_for_pending_screenshots()
         sys.exit(0)
 
 def main():
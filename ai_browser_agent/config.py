@@ -4,7 +4,9 @@ Contains site-specific selectors and behaviors to avoid hardcoding them in the m
 """
 
 import re
+from functools import lru_cache
 from typing import Dict, List, Union, Callable, Optional, Any
+from urllib.parse import urlsplit
 
 # Site detection patterns
 SITE_PATTERNS = {
@@ -20,6 +22,9 @@ SITE_PATTERNS = {
     "bestbuy": r"bestbuy\.com",
 }
 
+# Site detection patterns compiled once, matched case-insensitively
+SITE_PATTERNS_RE = {site: re.compile(pattern, re.IGNORECASE) for site, pattern in SITE_PATTERNS.items()}
+
 # Search selectors for different sites
 SEARCH_SELECTORS = {
     "amazon": "#twotabsearchtextbox",
@@ -118,6 +123,23 @@ GENERIC_FIRST_ITEM_SELECTORS = [
     "div[role='main'] a"
 ]
 
+# Sites known to have a usable search box
+KNOWN_SEARCHABLE_SITES = frozenset({
+    "google.com",
+    "bing.com",
+    "duckduckgo.com",
+    "yahoo.com",
+    "youtube.com",
+    "amazon.com",
+    "wikipedia.org",
+    "reddit.com",
+    "twitter.com",
+    "linkedin.com",
+})
+
+# Matches a URL containing any of the known searchable sites
+KNOWN_SEARCHABLE_SITES_RE = re.compile("|".join(map(re.escape, sorted(KNOWN_SEARCHABLE_SITES))), re.IGNORECASE)
+
 # Command patterns for natural language parsing
 COMMAND_PATTERNS = {
     "go_to_and_search": r"go\s+to\s+([a-z0-9.-]+(?:\.[a-z]{2,})?)(?:\s+and\s+|\s+to\s+)?search\s+for\s+(.*)",
@@ -142,9 +164,14 @@ def get_site_name(url: str) -> Optional[str]:
     Returns:
         The site name if recognized, None otherwise
     """
-    url = url.lower()
-    for site, pattern in SITE_PATTERNS.items():
-        if re.search(pattern, url):
+    # Match on the host only, so a site named in the path or query doesn't count
+    return _site_from_host((urlsplit(url).netloc or url).lower())
+
+@lru_cache(maxsize=256)
+def _site_from_host(host: str) -> Optional[str]:
+    """Match a host against the site patterns once, later lookups are served from the cache."""
+    for site, pattern in SITE_PATTERNS_RE.items():
+        if pattern.search(host):
             return site
     return None
 
@@ -193,7 +220,7 @@ def get_first_item_selectors(url: str) -> List[str]:
         return FIRST_ITEM_SELECTORS[site]
     return GENERIC_FIRST_ITEM_SELECTORS
 
-def is_known_searchable_site(url: str) -> list:
+def is_known_searchable_site(url: str) -> bool:
     """
     Check if the current site is a known site with search capabilities.
     
@@ -201,18 +228,6 @@ def is_known_searchable_site(url: str) -> list:
         url: The URL to analyze
         
     Returns:
-        List of known searchable site domains
+        True if the URL belongs to a known searchable site, False otherwise
     """
-    known_searchable_sites = [
-        "google.com",
-        "bing.com",
-        "duckduckgo.com",
-        "yahoo.com",
-        "youtube.com",
-        "amazon.com",
-        "wikipedia.org",
-        "reddit.com",
-        "twitter.com",
-        "linkedin.com"
-    ]
-    return known_searchable_sites 
\ No newline at end of file
+    return KNOWN_SEARCHABLE_SITES_RE.search(url) is not None